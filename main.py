@@ -1,6 +1,7 @@
 from utils import DataLoader
 from optimization import CropOptimizer
 import os
+import threading
 
 
 def main():
@@ -28,14 +29,24 @@ def main():
     print("问题1(1): 超过部分滞销")
     print("=" * 50)
     solution1 = optimizer.optimize(scenario=1)
-    optimizer.save_solution(solution1, os.path.join(output_dir, 'result1_1.xlsx'))
+    # Excel写盘放到后台线程, 与场景2的优化并行(写盘大多在I/O上释放GIL)
+    save1 = threading.Thread(
+        target=optimizer.save_solution,
+        args=(solution1, os.path.join(output_dir, 'result1_1.xlsx')))
+    save1.start()
 
     # 问题1(2): 超过部分降价50%
     print("\n" + "=" * 50)
     print("问题1(2): 超过部分降价50%")
     print("=" * 50)
     solution2 = optimizer.optimize(scenario=2)
-    optimizer.save_solution(solution2, os.path.join(output_dir, 'result1_2.xlsx'))
+    save2 = threading.Thread(
+        target=optimizer.save_solution,
+        args=(solution2, os.path.join(output_dir, 'result1_2.xlsx')))
+    save2.start()
+
+    save1.join()
+    save2.join()
 
     print(f"\n优化完成。结果已保存到 {output_dir}/")
     print("生成的文件:")
@@ -1,22 +1,51 @@
-import pulp
 import numpy as np
 import pandas as pd
 from typing import Dict, List, Tuple
-import random
+from collections import defaultdict, deque
 import math
-from utils import DataLoader, SolutionValidator
+from utils import (DataLoader, PlantingCell, SolutionValidator,
+                   bean_ids_from_crop_info)
+
+# 评估核函数的优先级: 已编译的Cython扩展 > numba JIT > 纯NumPy
+try:
+    from optimization_local_search import (fitness_kernel as cy_fitness_kernel,
+                                           penalty_kernel as cy_penalty_kernel)
+    HAS_CY_KERNELS = True
+except ImportError:  # 扩展未编译(python setup.py build_ext --inplace)
+    HAS_CY_KERNELS = False
+
+try:
+    from optimization_kernels import (fitness_kernel, penalty_kernel,
+                                      init_search_state, apply_cell_change,
+                                      multistart_kernel, warmup_kernels)
+    HAS_KERNELS = True
+except ImportError:  # numba不可用时退回纯NumPy实现
+    HAS_KERNELS = False
+
+
+# 季次与地块类型的整数编码: SoA数组的第三维/地块类型下标都按此排列,
+# 热路径上只做整数下标运算, 中文名仅在导出时使用
+SEASON_SINGLE, SEASON_FIRST, SEASON_SECOND = 0, 1, 2
+SEASONS = ('单季', '第一季', '第二季')
+SEASON_INDEX = {s: i for i, s in enumerate(SEASONS)}
+LAND_TYPES = ('平旱地', '梯田', '山坡地', '水浇地', '普通大棚', '智慧大棚')
+LAND_TYPE_INDEX = {t: i for i, t in enumerate(LAND_TYPES)}
 
 
 class CropOptimizer:
-    def __init__(self, data_loader: DataLoader):
+    def __init__(self, data_loader: DataLoader, seed: int = None):
         self.data_loader = data_loader
+        # 统一的NumPy随机数发生器: 一个种子即可复现, 且支持批量抽样
+        self._rng = np.random.default_rng(seed)
         self.land_info, self.crop_info, self.planting_2023, self.stats_info, self.expected_sales = data_loader.preprocess_data()
-        
+
         # 作物分类
         self.bean_crops = [crop_id for crop_id, info in self.crop_info.items()
                            if '豆类' in info['type']]
         self.non_bean_crops = [crop_id for crop_id, info in self.crop_info.items()
                                if '豆类' not in info['type']]
+        # 轮作验证用的豆类编号集合, 只算一次
+        self._bean_ids = bean_ids_from_crop_info(self.crop_info)
 
         # 地块分类
         self.flat_dry_lands = [land for land, info in self.land_info.items()
@@ -32,16 +61,125 @@ class CropOptimizer:
         self.smart_greenhouses = [land for land, info in self.land_info.items()
                                   if info['type'] == '智慧大棚']
 
+        # 数组化(SoA)表示所需的编码: 地块/地块类型/季次都映射到整数下标
+        self._lands = list(self.land_info)
+        self._land_index = {land: i for i, land in enumerate(self._lands)}
+        self._land_types = LAND_TYPES
+        self._land_type_index = LAND_TYPE_INDEX
+        self._seasons = SEASONS
+        self._season_index = SEASON_INDEX
+
+        self.n_lands = len(self._lands)
+        self.n_crops = max(self.crop_info)
+        self.n_years = 7  # 默认规划年数, optimize()会按实参更新
+
+        # 数据中的地块类型可能带有多余空白, 编码前先去掉
+        self._land_type_idx = np.array(
+            [self._land_type_index[str(self.land_info[land]['type']).strip()]
+             for land in self._lands],
+            dtype=np.int8)
+        self._land_areas = np.array(
+            [self.land_info[land]['area'] for land in self._lands],
+            dtype=np.float64)
+
+        # 作物编号 -> 显示名, 只在导出时用; 解结构本身不再存名字
+        self._crop_names = [''] * (self.n_crops + 1)
+        for cid, info in self.crop_info.items():
+            self._crop_names[cid] = info['name']
+
+        # 豆类掩码, 供约束惩罚使用
+        self._bean_mask = np.zeros(self.n_crops + 1, dtype=bool)
+        self._bean_mask[self.bean_crops] = True
+
+        # 各类候选作物只在初始化时算一次, 避免在内层循环里反复扫描crop_info
+        self._grain_ids = np.array(
+            [c for c in self.crop_info if '粮食' in self.crop_info[c]['type']],
+            dtype=np.int16)
+        self._veg_ids = np.array(
+            [c for c in self.crop_info
+             if self.crop_info[c]['type'] == '蔬菜' and c not in (37, 38, 39)],
+            dtype=np.int16)
+        self._second_veg_ids = np.array(
+            [c for c in (37, 38, 39) if c in self.crop_info], dtype=np.int16)
+        self._mushroom_ids = np.array(
+            [c for c in range(40, 44) if c in self.crop_info], dtype=np.int16)
+        self._rice_ids = np.array([18], dtype=np.int16)  # 水稻
+
+        self._build_candidate_table()
+
+        # 稠密查找表, 取代 stats_info 的元组字典查找
+        self._build_tables()
+
+        # 预热JIT核函数, 编译时间不计入优化循环
+        if HAS_KERNELS:
+            warmup_kernels()
+
+    def _build_candidate_table(self) -> None:
+        """建立(地块类型, 季次) -> 候选作物的定长查找表
+
+        以补齐的2维数组加长度数组存放, 方便后续numba核函数直接使用。
+        """
+        by_type_season = {
+            (0, 0): self._grain_ids, (1, 0): self._grain_ids, (2, 0): self._grain_ids,
+            (3, 0): self._rice_ids, (3, 1): self._veg_ids, (3, 2): self._second_veg_ids,
+            (4, 1): self._veg_ids, (4, 2): self._mushroom_ids,
+            (5, 1): self._veg_ids, (5, 2): self._veg_ids,
+        }
+        n_types = len(self._land_types)
+        n_seasons = len(self._seasons)
+        max_len = max(len(ids) for ids in by_type_season.values())
+
+        self._cand_tbl = np.zeros((n_types, n_seasons, max_len), dtype=np.int16)
+        self._cand_len = np.zeros((n_types, n_seasons), dtype=np.int16)
+        for (lt, s), ids in by_type_season.items():
+            self._cand_tbl[lt, s, :len(ids)] = ids
+            self._cand_len[lt, s] = len(ids)
+
+    def _build_tables(self) -> None:
+        """把 stats_info / expected_sales 展开为稠密数组查找表
+
+        表的形状为 (作物编号+1, 地块类型数, 季次数); 缺失的组合填0,
+        与原来字典查找失败时跳过该单元格的语义一致。
+        """
+        shape = (self.n_crops + 1, len(self._land_types), len(self._seasons))
+        self._yield_tbl = np.zeros(shape, dtype=np.float64)
+        self._cost_tbl = np.zeros(shape, dtype=np.float64)
+        self._price_tbl = np.zeros(shape, dtype=np.float64)
+
+        for (crop_id, land_type, season), stats in self.stats_info.items():
+            land_type = str(land_type).strip()
+            season = str(season).strip()
+            if land_type not in self._land_type_index or season not in self._season_index:
+                continue
+            lt = self._land_type_index[land_type]
+            s = self._season_index[season]
+            self._yield_tbl[crop_id, lt, s] = stats['yield_per_mu']
+            self._cost_tbl[crop_id, lt, s] = stats['cost_per_mu']
+            self._price_tbl[crop_id, lt, s] = (stats['min_price'] + stats['max_price']) / 2
+
+        # 预期销售量: 无记录的作物视为不限量(inf), 即收入不打折
+        self._expected = np.full(self.n_crops + 1, np.inf, dtype=np.float64)
+        for crop_id, sales in self.expected_sales.items():
+            self._expected[crop_id] = sales
+
+        # 每年收入上界: 各地块面积 x 该地块类型逐季的最高亩产值,
+        # 供适应度评估做"惩罚先行"的剪枝
+        per_mu_best = (self._yield_tbl * self._price_tbl).max(axis=0).sum(axis=1)
+        self._revenue_upper_per_year = float(
+            (self._land_areas * per_mu_best[self._land_type_idx]).sum())
+
     def optimize(self, scenario: int = 1, years: int = 7) -> Dict:
         """主优化函数"""
         print(f"开始优化，场景: {scenario}, 年数: {years}")
-        
+        self.n_years = years
+
         # 使用简化的优化方法
-        solution = self._simple_optimize(scenario, years)
-        
+        crop_id, area = self._simple_optimize(scenario, years)
+        solution = self._arrays_to_dict(crop_id, area)
+
         # 验证解的有效性
         validator = SolutionValidator()
-        if not validator.validate_rotation(solution, self.crop_info, years):
+        if not validator.validate_rotation(solution, self._bean_ids, years):
             print("警告: 豆类轮作约束未满足")
         if not validator.validate_no_replant(solution):
             print("警告: 重茬限制未满足")
@@ -49,380 +187,501 @@ class CropOptimizer:
             print("警告: 种植集中度约束未满足")
         if not validator.validate_min_area(solution, min_area=0.5):
             print("警告: 最小种植面积约束未满足")
-            
+
         return solution
 
-    def _simple_optimize(self, scenario: int, years: int) -> Dict:
+    def sa_optimize(self, scenario: int = 1, years: int = 7,
+                    iterations: int = 100) -> Dict:
+        """模拟退火优化入口, 可控制退火迭代次数(便于快速测试)"""
+        print(f"开始模拟退火优化，场景: {scenario}, 年数: {years}, 迭代: {iterations}")
+        self.n_years = years
+        crop_id, area = self._simple_optimize(scenario, years, iterations)
+        return self._arrays_to_dict(crop_id, area)
+
+    def _simple_optimize(self, scenario: int, years: int,
+                         iterations: int = 100) -> Tuple[np.ndarray, np.ndarray]:
         """简化的优化方法"""
         print("使用简化优化方法...")
-        
-        # 生成多个初始解并选择最好的
-        best_solution = None
-        best_fitness = float('-inf')
-        
-        for i in range(10):  # 生成10个初始解
-            print(f"生成第 {i+1}/10 个初始解...")
-            solution = self._generate_initial_solution(years)
-            fitness = self._calculate_fitness(solution, scenario)
-            
-            if fitness > best_fitness:
-                best_fitness = fitness
-                best_solution = solution.copy()
-        
+        n_starts = 10
+
+        if HAS_KERNELS:
+            # 多起点相互独立, 在JIT核函数里用prange并行生成和评估
+            print(f"并行生成 {n_starts} 个初始解...")
+            seeds = self._rng.integers(0, 2**31 - 1, size=n_starts).astype(np.int64)
+            fitnesses, all_crop, all_area = multistart_kernel(
+                seeds, years, len(self._seasons), self._land_type_idx,
+                self._land_areas, self._cand_tbl, self._cand_len,
+                self._yield_tbl, self._cost_tbl, self._price_tbl,
+                self._expected, self._bean_mask, scenario)
+            best = int(np.argmax(fitnesses))
+            best_fitness = float(fitnesses[best])
+            best_crop_id = all_crop[best].copy()
+            best_area = all_area[best].copy()
+        else:
+            # 生成多个初始解并选择最好的
+            best_crop_id = None
+            best_area = None
+            best_fitness = float('-inf')
+
+            for i in range(n_starts):
+                print(f"生成第 {i+1}/{n_starts} 个初始解...")
+                crop_id, area = self._generate_initial_solution(years)
+                fitness = self._calculate_fitness(crop_id, area, scenario)
+
+                if fitness > best_fitness:
+                    best_fitness = fitness
+                    best_crop_id = crop_id.copy()
+                    best_area = area.copy()
+
         print(f"最佳初始解适应度: {best_fitness:.2f}")
-        
-        # 简单的局部搜索优化
+
+        # 模拟退火局部搜索
         print("进行局部搜索优化...")
-        best_solution = self._simple_local_search(best_solution, scenario)
-        
-        return best_solution
+        best_crop_id, best_area = self._simple_local_search(
+            best_crop_id, best_area, scenario, iterations)
 
-    def _generate_initial_solution(self, years: int) -> Dict:
-        """生成初始解"""
-        solution = {}
-        
-        for land in self.land_info:
-            solution[land] = {}
-            land_type = self.land_info[land]['type']
-            area = self.land_info[land]['area']
-            
-            for year in range(years):
-                solution[land][year] = {}
-                
-                if land_type in ['平旱地', '梯田', '山坡地']:
-                    # 单季粮食作物
-                    grain_crops = [c for c in self.crop_info if '粮食' in self.crop_info[c]['type']]
-                    if grain_crops:
-                        crop_id = random.choice(grain_crops)
-                        solution[land][year]['单季'] = {
-                            'crop_id': crop_id,
-                            'crop_name': self.crop_info[crop_id]['name'],
-                            'area': area
-                        }
-                
-                elif land_type == '水浇地':
-                    # 随机选择单季水稻或两季蔬菜
-                    if random.random() < 0.5:
-                        # 单季水稻
-                        solution[land][year]['单季'] = {
-                            'crop_id': 18,  # 水稻
-                            'crop_name': '水稻',
-                            'area': area
-                        }
-                    else:
-                        # 两季蔬菜
-                        veg_crops = [c for c in self.crop_info if self.crop_info[c]['type'] == '蔬菜' and c not in [37, 38, 39]]
-                        if veg_crops:
-                            crop_id = random.choice(veg_crops)
-                            solution[land][year]['第一季'] = {
-                                'crop_id': crop_id,
-                                'crop_name': self.crop_info[crop_id]['name'],
-                                'area': area
-                            }
-                        
-                        # 第二季蔬菜（大白菜、白萝卜、红萝卜）
-                        second_crops = [c for c in [37, 38, 39] if c in self.crop_info]
-                        if second_crops:
-                            crop_id = random.choice(second_crops)
-                            solution[land][year]['第二季'] = {
-                                'crop_id': crop_id,
-                                'crop_name': self.crop_info[crop_id]['name'],
-                                'area': area
-                            }
-                
-                elif land_type == '普通大棚':
-                    # 第一季蔬菜
-                    veg_crops = [c for c in self.crop_info if self.crop_info[c]['type'] == '蔬菜' and c not in [37, 38, 39]]
-                    if veg_crops:
-                        crop_id = random.choice(veg_crops)
-                        solution[land][year]['第一季'] = {
-                            'crop_id': crop_id,
-                            'crop_name': self.crop_info[crop_id]['name'],
-                            'area': area
-                        }
-                    
-                    # 第二季食用菌
-                    mushroom_crops = [c for c in range(40, 44) if c in self.crop_info]
-                    if mushroom_crops:
-                        crop_id = random.choice(mushroom_crops)
-                        solution[land][year]['第二季'] = {
-                            'crop_id': crop_id,
-                            'crop_name': self.crop_info[crop_id]['name'],
-                            'area': area
-                        }
-                
-                elif land_type == '智慧大棚':
-                    # 两季蔬菜
-                    for season in ['第一季', '第二季']:
-                        veg_crops = [c for c in self.crop_info if self.crop_info[c]['type'] == '蔬菜' and c not in [37, 38, 39]]
-                        if veg_crops:
-                            crop_id = random.choice(veg_crops)
-                            solution[land][year][season] = {
-                                'crop_id': crop_id,
-                                'crop_name': self.crop_info[crop_id]['name'],
-                                'area': area
-                            }
-        
-        return solution
+        return best_crop_id, best_area
 
-    def _calculate_fitness(self, solution: Dict, scenario: int) -> float:
-        """计算适应度（利润）"""
-        total_profit = 0
-        
-        for land in solution:
-            land_type = self.land_info[land]['type']
-            
-            for year in solution[land]:
-                for season in solution[land][year]:
-                    crop_id = solution[land][year][season]['crop_id']
-                    area = solution[land][year][season]['area']
-                    
-                    key = (crop_id, land_type, season)
-                    if key not in self.stats_info:
-                        continue
-                    
-                    stats = self.stats_info[key]
-                    yield_per_mu = stats['yield_per_mu']
-                    cost = stats['cost_per_mu']
-                    price = (stats['min_price'] + stats['max_price']) / 2
-                    total_yield = yield_per_mu * area
-                    
-                    # 计算收入
-                    if crop_id in self.expected_sales:
-                        expected = self.expected_sales[crop_id]
-                        if scenario == 1:  # 滞销
-                            revenue = min(total_yield, expected) * price
-                        else:  # 降价50%
-                            revenue = min(total_yield, expected) * price + max(0, total_yield - expected) * price * 0.5
-                    else:
-                        revenue = total_yield * price
-                    
-                    # 减去成本
-                    total_profit += revenue - cost * area
-        
-        # 添加约束惩罚
-        penalty = self._calculate_constraint_penalty(solution)
-        
-        return total_profit - penalty
-
-    def _calculate_constraint_penalty(self, solution: Dict) -> float:
+    def _generate_initial_solution(self, years: int) -> Tuple[np.ndarray, np.ndarray]:
+        """生成初始解
+
+        解采用SoA数组表示: crop_id[地块, 年, 季次] (int16, -1表示未种植)
+        和 area[地块, 年, 季次] (float64)。随机数按地块类型整批抽取,
+        避免逐单元格调用随机函数的开销。
+        """
+        crop_id = np.full((self.n_lands, years, len(self._seasons)), -1, dtype=np.int16)
+        area = np.zeros((self.n_lands, years, len(self._seasons)), dtype=np.float64)
+
+        rng = self._rng
+        lt = self._land_type_idx
+        areas = self._land_areas
+
+        def pick(ids, shape):
+            return ids[rng.integers(0, len(ids), size=shape)]
+
+        # 平旱地/梯田/山坡地: 单季粮食作物
+        idx = np.where(lt <= 2)[0]
+        if idx.size and len(self._grain_ids):
+            crop_id[idx, :, 0] = pick(self._grain_ids, (idx.size, years))
+            area[idx, :, 0] = areas[idx][:, None]
+
+        # 水浇地: 每年掷硬币选单季水稻或两季蔬菜
+        idx = np.where(lt == 3)[0]
+        if idx.size:
+            rice = rng.random((idx.size, years)) < 0.5
+            crop_id[idx, :, 0] = np.where(rice, self._rice_ids[0], -1)
+            area[idx, :, 0] = np.where(rice, areas[idx][:, None], 0.0)
+            if len(self._veg_ids):
+                crop_id[idx, :, 1] = np.where(~rice, pick(self._veg_ids, (idx.size, years)), -1)
+                area[idx, :, 1] = np.where(~rice, areas[idx][:, None], 0.0)
+            if len(self._second_veg_ids):
+                crop_id[idx, :, 2] = np.where(~rice, pick(self._second_veg_ids, (idx.size, years)), -1)
+                area[idx, :, 2] = np.where(~rice, areas[idx][:, None], 0.0)
+
+        # 普通大棚: 第一季蔬菜 + 第二季食用菌
+        idx = np.where(lt == 4)[0]
+        if idx.size:
+            if len(self._veg_ids):
+                crop_id[idx, :, 1] = pick(self._veg_ids, (idx.size, years))
+                area[idx, :, 1] = areas[idx][:, None]
+            if len(self._mushroom_ids):
+                crop_id[idx, :, 2] = pick(self._mushroom_ids, (idx.size, years))
+                area[idx, :, 2] = areas[idx][:, None]
+
+        # 智慧大棚: 两季蔬菜
+        idx = np.where(lt == 5)[0]
+        if idx.size and len(self._veg_ids):
+            for s in (SEASON_FIRST, SEASON_SECOND):
+                crop_id[idx, :, s] = pick(self._veg_ids, (idx.size, years))
+                area[idx, :, s] = areas[idx][:, None]
+
+        return crop_id, area
+
+    def _calculate_fitness(self, crop_id: np.ndarray, area: np.ndarray, scenario: int,
+                           best_known: float = float('-inf')) -> float:
+        """计算适应度（利润）, 全部用向量化数组运算
+
+        收入按(年,作物)在全村的年度总产量与预期销售量(年度口径)比较:
+        超出部分在场景1滞销(不计收入), 场景2按50%价格出售。
+        给定best_known时先算惩罚: 若收入上界减惩罚已无法超过它,
+        直接返回-inf, 省掉收入计算。
+        """
+        revenue_upper = self._revenue_upper_per_year * crop_id.shape[1]
+        if HAS_CY_KERNELS:
+            return float(cy_fitness_kernel(
+                crop_id, area, self._land_type_idx,
+                self._yield_tbl, self._cost_tbl, self._price_tbl,
+                self._expected, self._bean_mask, scenario,
+                revenue_upper, best_known))
+        if HAS_KERNELS:
+            return float(fitness_kernel(
+                crop_id, area, self._land_type_idx,
+                self._yield_tbl, self._cost_tbl, self._price_tbl,
+                self._expected, self._bean_mask, scenario,
+                revenue_upper, best_known))
+
+        # 惩罚先行, 便宜得多; 上界剪枝时跳过收入计算
+        penalty = self._calculate_constraint_penalty(crop_id, area)
+        if revenue_upper - penalty <= best_known:
+            return float('-inf')
+
+        planted = crop_id >= 0
+        cid = np.where(planted, crop_id, 0)  # 0号作物不存在, 查表结果为0
+
+        lt = self._land_type_idx[:, None, None]
+        s = np.arange(len(self._seasons))[None, None, :]
+
+        total_yield = self._yield_tbl[cid, lt, s] * area
+        cell_revenue = total_yield * self._price_tbl[cid, lt, s]
+        total_cost = (self._cost_tbl[cid, lt, s] * area)[planted].sum()
+
+        # 按(年,作物)聚合产量和全价收入
+        years = crop_id.shape[1]
+        y_idx = np.arange(years)[None, :, None]
+        key = (np.broadcast_to(y_idx, cid.shape)[planted] * (self.n_crops + 1)
+               + cid[planted])
+        agg_yield = np.bincount(key, weights=total_yield[planted],
+                                minlength=years * (self.n_crops + 1)
+                                ).reshape(years, self.n_crops + 1)
+        agg_revenue = np.bincount(key, weights=cell_revenue[planted],
+                                  minlength=years * (self.n_crops + 1)
+                                  ).reshape(years, self.n_crops + 1)
+
+        # 每年可按全价出售的比例
+        sold_frac = np.ones((years, self.n_crops + 1))
+        nonzero = agg_yield > 0
+        sold_frac[nonzero] = np.minimum(
+            1.0,
+            np.broadcast_to(self._expected, agg_yield.shape)[nonzero]
+            / agg_yield[nonzero])
+
+        if scenario == 1:  # 滞销
+            revenue = (agg_revenue * sold_frac).sum()
+        else:  # 降价50%
+            revenue = (agg_revenue * (0.5 + 0.5 * sold_frac)).sum()
+
+        return revenue - total_cost - penalty
+
+    def _calculate_constraint_penalty(self, crop_id: np.ndarray, area: np.ndarray) -> float:
         """计算约束违反的惩罚"""
-        penalty = 0
-        
+        if HAS_CY_KERNELS:
+            return float(cy_penalty_kernel(crop_id, area, self._bean_mask, self.n_crops))
+        if HAS_KERNELS:
+            return float(penalty_kernel(crop_id, area, self._bean_mask, self.n_crops))
+
+        penalty = 0.0
+        n_lands, years, n_seasons = crop_id.shape
+        planted = crop_id >= 0
+        cid = np.where(planted, crop_id, 0)
+
         # 1. 豆类轮作约束惩罚
-        for land in solution:
-            bean_planted = False
-            for year in range(len(solution[land])):
-                for season in ['单季', '第一季', '第二季']:
-                    if year in solution[land] and season in solution[land][year]:
-                        crop_id = solution[land][year][season]['crop_id']
-                        if crop_id in self.bean_crops:
-                            bean_planted = True
-                            break
-                if bean_planted:
-                    break
-            if not bean_planted:
-                penalty += 100000
-        
+        has_bean = (self._bean_mask[cid] & planted).any(axis=(1, 2))
+        penalty += 100000.0 * np.count_nonzero(~has_bean)
+
         # 2. 重茬种植惩罚
-        for land in solution:
-            prev_crop = None
-            for year in range(len(solution[land])):
-                for season in ['单季', '第一季', '第二季']:
-                    if year in solution[land] and season in solution[land][year]:
-                        current_crop = solution[land][year][season]['crop_id']
-                        if current_crop == prev_crop:
-                            penalty += 50000
-                        prev_crop = current_crop
-        
+        for l in range(n_lands):
+            seq = crop_id[l].reshape(-1)
+            seq = seq[seq >= 0]
+            if seq.size > 1:
+                penalty += 50000.0 * np.count_nonzero(seq[1:] == seq[:-1])
+
         # 3. 种植集中度惩罚
-        for year in range(len(solution[list(solution.keys())[0]])):
-            for season in ['单季', '第一季', '第二季']:
-                crop_distribution = {}
-                for land in solution:
-                    if year in solution[land] and season in solution[land][year]:
-                        crop_id = solution[land][year][season]['crop_id']
-                        if crop_id not in crop_distribution:
-                            crop_distribution[crop_id] = set()
-                        crop_distribution[crop_id].add(land)
-                
-                for crop_id, lands in crop_distribution.items():
-                    # 每种作物每季至少种植在2个地块上，但不超过8个地块
-                    if len(lands) < 2:
-                        penalty += 50000 * (2 - len(lands))
-                    elif len(lands) > 8:
-                        penalty += 30000 * (len(lands) - 8)
-        
+        # counts[年, 季次, 作物] = 该作物该季种植的地块数
+        counts = np.zeros((years, n_seasons, self.n_crops + 1), dtype=np.int32)
+        l_idx, y_idx, s_idx = np.nonzero(planted)
+        np.add.at(counts, (y_idx, s_idx, crop_id[l_idx, y_idx, s_idx]), 1)
+
+        # 每种作物每季至少种植在2个地块上，但不超过8个地块
+        # (无分支的向量化写法)
+        present = counts > 0
+        under = np.where(present & (counts < 2), 2 - counts, 0)
+        over = np.maximum(counts - 8, 0)
+        penalty += 50000.0 * under.sum() + 30000.0 * over.sum()
+
         # 4. 最小种植面积惩罚
-        for land in solution:
-            for year in solution[land]:
-                for season in solution[land][year]:
-                    area = solution[land][year][season]['area']
-                    if area < 0.5:
-                        penalty += 20000 * (0.5 - area)
-        
+        small = planted & (area < 0.5)
+        penalty += 20000.0 * (0.5 - area[small]).sum()
+
         return penalty
 
-    def _simple_local_search(self, solution: Dict, scenario: int) -> Dict:
-        """简化的局部搜索优化"""
-        best_solution = solution.copy()
-        best_fitness = self._calculate_fitness(best_solution, scenario)
-        
-        improved = True
-        iterations = 0
-        max_iterations = 100  # 减少迭代次数
-        
-        while improved and iterations < max_iterations:
-            improved = False
-            iterations += 1
-            
-            # 随机选择一些地块进行修改
-            lands_to_modify = random.sample(list(best_solution.keys()), min(5, len(best_solution)))
-            
-            for land in lands_to_modify:
-                year = random.randint(0, len(best_solution[land]) - 1)
-                
-                # 尝试修改该地块该年的种植
-                test_solution = best_solution.copy()
-                land_type = self.land_info[land]['type']
-                area = self.land_info[land]['area']
-                
-                # 清空该地块该年的种植
-                test_solution[land][year] = {}
-                
-                # 重新生成种植方案
-                if land_type in ['平旱地', '梯田', '山坡地']:
-                    grain_crops = [c for c in self.crop_info if '粮食' in self.crop_info[c]['type']]
-                    if grain_crops:
-                        crop_id = random.choice(grain_crops)
-                        test_solution[land][year]['单季'] = {
-                            'crop_id': crop_id,
-                            'crop_name': self.crop_info[crop_id]['name'],
-                            'area': area
-                        }
-                
-                elif land_type == '水浇地':
-                    if random.random() < 0.5:
-                        test_solution[land][year]['单季'] = {
-                            'crop_id': 18,
-                            'crop_name': '水稻',
-                            'area': area
-                        }
-                    else:
-                        veg_crops = [c for c in self.crop_info if self.crop_info[c]['type'] == '蔬菜' and c not in [37, 38, 39]]
-                        if veg_crops:
-                            crop_id = random.choice(veg_crops)
-                            test_solution[land][year]['第一季'] = {
-                                'crop_id': crop_id,
-                                'crop_name': self.crop_info[crop_id]['name'],
-                                'area': area
-                            }
-                        
-                        second_crops = [c for c in [37, 38, 39] if c in self.crop_info]
-                        if second_crops:
-                            crop_id = random.choice(second_crops)
-                            test_solution[land][year]['第二季'] = {
-                                'crop_id': crop_id,
-                                'crop_name': self.crop_info[crop_id]['name'],
-                                'area': area
-                            }
-                
-                elif land_type == '普通大棚':
-                    veg_crops = [c for c in self.crop_info if self.crop_info[c]['type'] == '蔬菜' and c not in [37, 38, 39]]
-                    if veg_crops:
-                        crop_id = random.choice(veg_crops)
-                        test_solution[land][year]['第一季'] = {
-                            'crop_id': crop_id,
-                            'crop_name': self.crop_info[crop_id]['name'],
-                            'area': area
-                        }
-                    
-                    mushroom_crops = [c for c in range(40, 44) if c in self.crop_info]
-                    if mushroom_crops:
-                        crop_id = random.choice(mushroom_crops)
-                        test_solution[land][year]['第二季'] = {
-                            'crop_id': crop_id,
-                            'crop_name': self.crop_info[crop_id]['name'],
-                            'area': area
-                        }
-                
-                elif land_type == '智慧大棚':
-                    for season in ['第一季', '第二季']:
-                        veg_crops = [c for c in self.crop_info if self.crop_info[c]['type'] == '蔬菜' and c not in [37, 38, 39]]
-                        if veg_crops:
-                            crop_id = random.choice(veg_crops)
-                            test_solution[land][year][season] = {
-                                'crop_id': crop_id,
-                                'crop_name': self.crop_info[crop_id]['name'],
-                                'area': area
-                            }
-                
-                # 计算新解的适应度
-                new_fitness = self._calculate_fitness(test_solution, scenario)
-                
-                if new_fitness > best_fitness:
-                    best_solution = test_solution
-                    best_fitness = new_fitness
-                    improved = True
-                    break
-        
+    def _simple_local_search(self, crop_id: np.ndarray, area: np.ndarray,
+                             scenario: int,
+                             iterations: int = 100) -> Tuple[np.ndarray, np.ndarray]:
+        """模拟退火局部搜索
+
+        贪心只接受严格改进, 很快卡在局部最优; 这里按模拟退火准则
+        以 exp(delta/T) 的概率接受差解, 温度几何降温(x0.95),
+        连续多次没有改进时复温到初温的一半重新探索。
+        numba可用时采用增量评估: 维护按作物聚合的产量/收入、
+        集中度计数等状态, 每次试探只更新被修改单元格的贡献(O(1)级),
+        而不是重算整个解(O(地块x年x季次))。
+        """
+        current_crop = crop_id.copy()
+        current_area = area.copy()
+        current_fitness = self._calculate_fitness(current_crop, current_area, scenario)
+
+        best_crop_id = current_crop.copy()
+        best_area = current_area.copy()
+        best_fitness = current_fitness
+
+        if HAS_KERNELS:
+            state = init_search_state(
+                current_crop, current_area, self._land_type_idx,
+                self._yield_tbl, self._cost_tbl, self._price_tbl,
+                self._bean_mask, self.n_crops)
+
+        years = crop_id.shape[1]
+
+        # 禁忌表: 记住最近被拒绝的(地块,年,新方案), 不再重复评估
+        tabu = deque(maxlen=50)
+
+        # 初温按适应度量级取; 几何降温
+        initial_temp = max(abs(current_fitness) / 100.0, 1.0)
+        temp = initial_temp
+        stall = 0  # 连续未改进best的迭代数
+
+        for _ in range(iterations):
+            iter_improved = False
+
+            # 一次批量提出64个候选变异, 向量化估算增量后按增量从优到劣
+            # 精确评估, 最多试5个 — 摊薄Python/NumPy边界开销
+            contrib = self._cell_contributions(current_crop, current_area)
+            ls, ys, cand_crop, cand_area, deltas = self._propose_batch(contrib)
+            order = np.argsort(deltas)[::-1][:5]
+
+            for k in order:
+                l = int(ls[k])
+                year = int(ys[k])
+
+                # 只备份受影响的(地块,年)切片, 原地修改后按需回滚,
+                # 避免每次试探都复制整个解
+                saved_crop = current_crop[l, year, :].copy()
+                saved_area = current_area[l, year, :].copy()
+                current_crop[l, year, :] = cand_crop[k]
+                current_area[l, year, :] = cand_area[k]
+
+                # 最近拒绝过的同样修改直接跳过, 省一次评估
+                move = (l, year, current_crop[l, year, :].tobytes())
+                if move in tabu:
+                    current_crop[l, year, :] = saved_crop
+                    current_area[l, year, :] = saved_area
+                    continue
+
+                # 计算新解的适应度; 剪枝阈值取acceptance概率约e^-40处,
+                # 被剪掉(-inf)的解反正不会被退火接受
+                if HAS_KERNELS:
+                    new_fitness = float(apply_cell_change(
+                        current_crop, current_area, l, year, saved_crop, saved_area,
+                        self._land_type_idx, self._yield_tbl, self._cost_tbl,
+                        self._price_tbl, self._bean_mask, self._expected,
+                        scenario, *state))
+                else:
+                    new_fitness = self._calculate_fitness(
+                        current_crop, current_area, scenario,
+                        best_known=current_fitness - 40.0 * temp)
+
+                delta = new_fitness - current_fitness
+                if delta > 0 or self._rng.random() < math.exp(delta / temp):
+                    # 接受(可能是差解)
+                    current_fitness = new_fitness
+                    if current_fitness > best_fitness:
+                        best_fitness = current_fitness
+                        best_crop_id = current_crop.copy()
+                        best_area = current_area.copy()
+                        iter_improved = True
+                else:
+                    tabu.append(move)
+                    # 回滚本次修改: 恢复切片, 并把状态增量反向应用
+                    new_crop = current_crop[l, year, :].copy()
+                    new_area = current_area[l, year, :].copy()
+                    current_crop[l, year, :] = saved_crop
+                    current_area[l, year, :] = saved_area
+                    if HAS_KERNELS:
+                        apply_cell_change(
+                            current_crop, current_area, l, year, new_crop, new_area,
+                            self._land_type_idx, self._yield_tbl, self._cost_tbl,
+                            self._price_tbl, self._bean_mask, self._expected,
+                            scenario, *state)
+
+            temp *= 0.95
+            if iter_improved:
+                stall = 0
+            else:
+                stall += 1
+                if stall >= 20:  # 长时间停滞就复温, 跳出局部最优
+                    temp = 0.5 * initial_temp
+                    stall = 0
+
         print(f"局部搜索完成，最终适应度: {best_fitness:.2f}")
-        return best_solution
+        return best_crop_id, best_area
+
+    def _propose_batch(self, contrib: np.ndarray, k: int = 64):
+        """批量生成k个候选(地块,年)变异并向量化估算利润增量
+
+        前3个候选盯住贡献最差的单元格, 其余随机。候选的新种植方案
+        按地块类型整批抽取, 增量按全价利润估算(与_cell_contributions
+        同口径), 只用于给候选排序 — 精确评估仍由增量核函数完成。
+        """
+        n_lands, years = contrib.shape
+        n_seasons = len(self._seasons)
+        rng = self._rng
+
+        worst = np.unravel_index(np.argsort(contrib, axis=None)[:3], contrib.shape)
+        ls = np.concatenate([worst[0].astype(np.int64),
+                             rng.integers(0, n_lands, k - 3)])
+        ys = np.concatenate([worst[1].astype(np.int64),
+                             rng.integers(0, years, k - 3)])
+
+        lt = self._land_type_idx[ls]
+        la = self._land_areas[ls]
+        cand_crop = np.full((k, n_seasons), -1, dtype=np.int16)
+        cand_area = np.zeros((k, n_seasons))
+
+        def pick(ids, m):
+            return ids[rng.integers(0, len(ids), size=int(m.sum()))]
 
-    def save_solution(self, solution: Dict, filename: str) -> None:
-        """保存解决方案到Excel，保持原有格式"""
+        m = lt <= 2  # 平旱地/梯田/山坡地: 单季粮食
+        if m.any() and len(self._grain_ids):
+            cand_crop[m, SEASON_SINGLE] = pick(self._grain_ids, m)
+            cand_area[m, SEASON_SINGLE] = la[m]
+
+        m = lt == 3  # 水浇地: 掷硬币选单季水稻或两季蔬菜
+        if m.any():
+            coin = rng.random(k) < 0.5
+            mr = m & coin
+            cand_crop[mr, SEASON_SINGLE] = self._rice_ids[0]
+            cand_area[mr, SEASON_SINGLE] = la[mr]
+            mv = m & ~coin
+            if len(self._veg_ids):
+                cand_crop[mv, SEASON_FIRST] = pick(self._veg_ids, mv)
+                cand_area[mv, SEASON_FIRST] = la[mv]
+            if len(self._second_veg_ids):
+                cand_crop[mv, SEASON_SECOND] = pick(self._second_veg_ids, mv)
+                cand_area[mv, SEASON_SECOND] = la[mv]
+
+        m = lt == 4  # 普通大棚: 第一季蔬菜 + 第二季食用菌
+        if m.any():
+            if len(self._veg_ids):
+                cand_crop[m, SEASON_FIRST] = pick(self._veg_ids, m)
+                cand_area[m, SEASON_FIRST] = la[m]
+            if len(self._mushroom_ids):
+                cand_crop[m, SEASON_SECOND] = pick(self._mushroom_ids, m)
+                cand_area[m, SEASON_SECOND] = la[m]
+
+        m = lt == 5  # 智慧大棚: 两季蔬菜
+        if m.any() and len(self._veg_ids):
+            for s in (SEASON_FIRST, SEASON_SECOND):
+                cand_crop[m, s] = pick(self._veg_ids, m)
+                cand_area[m, s] = la[m]
+
+        # 向量化的利润增量估算(高级索引一次查表)
+        cid = np.where(cand_crop >= 0, cand_crop, 0)
+        s = np.arange(n_seasons)[None, :]
+        prof = (self._yield_tbl[cid, lt[:, None], s] * cand_area
+                * self._price_tbl[cid, lt[:, None], s]
+                - self._cost_tbl[cid, lt[:, None], s] * cand_area).sum(axis=1)
+        deltas = prof - contrib[ls, ys]
+
+        return ls, ys, cand_crop, cand_area, deltas
+
+    def _cell_contributions(self, crop_id: np.ndarray, area: np.ndarray) -> np.ndarray:
+        """每个(地块,年)的利润贡献(全价收入减成本, 不含销量折扣)
+
+        只用来给局部搜索挑选最值得改的单元格, 不要求和适应度完全一致。
+        """
+        planted = crop_id >= 0
+        cid = np.where(planted, crop_id, 0)
+        lt = self._land_type_idx[:, None, None]
+        s = np.arange(crop_id.shape[2])[None, None, :]
+
+        total_yield = self._yield_tbl[cid, lt, s] * area
+        profit = (total_yield * self._price_tbl[cid, lt, s]
+                  - self._cost_tbl[cid, lt, s] * area)
+        profit[~planted] = 0.0
+        return profit.sum(axis=2)
+
+    def _arrays_to_dict(self, crop_id: np.ndarray, area: np.ndarray) -> Dict:
+        """把SoA数组解转换回嵌套字典, 供保存和验证使用"""
+        solution = {}
+        n_lands, years, n_seasons = crop_id.shape
+
+        for l in range(n_lands):
+            land = self._lands[l]
+            solution[land] = {}
+            for year in range(years):
+                solution[land][year] = {}
+                for s in range(n_seasons):
+                    cid = int(crop_id[l, year, s])
+                    if cid < 0:
+                        continue
+                    solution[land][year][self._seasons[s]] = PlantingCell(
+                        crop_id=cid, area=float(area[l, year, s]))
+
+        return solution
+
+    def save_solution(self, solution: Dict, filename: str, years: int = None) -> None:
+        """保存解决方案到Excel，保持原有格式
+
+        years缺省时从solution本身推断年数, 不读self.n_years:
+        保存常在后台线程进行, 主线程可能已带着别的年数进入下一次optimize。
+        """
         # 创建结果矩阵
-        years = 7
+        if years is None:
+            years = 1 + max((y for land in solution.values() for y in land),
+                            default=self.n_years - 1)
         seasons = ['第一季', '第二季', '单季']
-        
+
         # 初始化结果矩阵
         result_data = []
-        
+
         for season in seasons:
             for year in range(years):
                 row = {'Unnamed: 0': f'{season}\n{2024 + year}', '地块名': ''}
-                
+
                 # 初始化所有作物为NaN
                 for crop_id in range(1, 45):
                     if crop_id in self.crop_info:
                         row[self.crop_info[crop_id]['name']] = np.nan
-                
+
                 result_data.append(row)
-        
+
+        # 行索引: 行标签 -> 行号, 避免每个单元格线性扫描所有行
+        row_idx = {row['Unnamed: 0']: i for i, row in enumerate(result_data)}
+        # 地块名按行收集, 最后一次join, 避免逐个拼接字符串
+        land_names_by_row = defaultdict(list)
+
         # 填充种植数据
         for land in solution:
             for year in solution[land]:
                 for season in solution[land][year]:
                     crop = solution[land][year][season]
-                    crop_id = crop['crop_id']
-                    crop_name = crop['crop_name']
-                    area = crop['area']
-                    
-                    # 找到对应的行
-                    row_key = f'{season}\n{2024 + year}'
-                    
-                    # 更新地块名和种植面积
-                    for row in result_data:
-                        if row['Unnamed: 0'] == row_key:
-                            if pd.isna(row['地块名']) or row['地块名'] == '':
-                                row['地块名'] = land
-                            else:
-                                row['地块名'] += f' {land}'
-                            
-                            if crop_name in row:
-                                row[crop_name] = area
-                            break
-        
+                    crop_name = self._crop_names[crop.crop_id]
+
+                    i = row_idx.get(f'{season}\n{2024 + year}')
+                    if i is None:
+                        continue
+                    land_names_by_row[i].append(land)
+                    if crop_name in result_data[i]:
+                        result_data[i][crop_name] = crop.area
+
+        for i, names in land_names_by_row.items():
+            result_data[i]['地块名'] = ' '.join(names)
+
         # 创建DataFrame
         result_df = pd.DataFrame(result_data)
-        
+
         # 简单保存到文件
         try:
-            result_df.to_excel(filename, index=False)
+            try:
+                # xlsxwriter比默认的openpyxl引擎写得快且省内存
+                with pd.ExcelWriter(filename, engine='xlsxwriter') as writer:
+                    result_df.to_excel(writer, index=False)
+            except ModuleNotFoundError:
+                result_df.to_excel(filename, index=False)
             print(f"结果已保存到 {filename}")
         except Exception as e:
             print(f"保存文件时出现错误: {e}")
             # 尝试保存为CSV格式作为备选
             csv_filename = filename.replace('.xlsx', '.csv')
             result_df.to_csv(csv_filename, index=False, encoding='utf-8-sig')
-            print(f"结果已保存为CSV格式: {csv_filename}")
\ No newline at end of file
+            print(f"结果已保存为CSV格式: {csv_filename}")
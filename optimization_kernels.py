@@ -0,0 +1,349 @@
+"""Numba编译的优化热点核函数
+
+适应度和约束惩罚在局部搜索中每次试探都会调用, 是整个优化的瓶颈。
+这里的核函数只操作普通的整数/浮点ndarray(不用Python字典),
+由 @njit 编译为本地代码。optimization.py 在numba不可用时
+会退回纯NumPy实现。
+"""
+import numpy as np
+from numba import njit, prange
+
+
+@njit(cache=True, fastmath=True)
+def penalty_kernel(crop_id, area, bean_mask, n_crops):
+    """计算约束违反的惩罚
+
+    单次遍历同时累计: 豆类标记(每地块)、重茬、最小面积,
+    以及每(年,季次,作物)的种植地块数; 再对计数数组做第二次
+    遍历套用 <2 和 >8 的集中度惩罚。
+    """
+    n_lands, years, n_seasons = crop_id.shape
+    penalty = 0.0
+    counts = np.zeros((years, n_seasons, n_crops + 1), dtype=np.int32)
+
+    for l in range(n_lands):
+        has_bean = False
+        prev = -1
+        for y in range(years):
+            for s in range(n_seasons):
+                c = crop_id[l, y, s]
+                if c < 0:
+                    continue
+                if bean_mask[c]:
+                    has_bean = True
+                if c == prev:
+                    penalty += 50000.0
+                prev = c
+                counts[y, s, c] += 1
+                a = area[l, y, s]
+                if a < 0.5:
+                    penalty += 20000.0 * (0.5 - a)
+        if not has_bean:
+            penalty += 100000.0
+
+    # 无分支的集中度惩罚: max/乘法代替逐计数的if, LLVM可自动向量化
+    for y in range(years):
+        for s in range(n_seasons):
+            for c in range(n_crops + 1):
+                cnt = counts[y, s, c]
+                under = max(2 - cnt, 0) * np.int32(cnt > 0)
+                over = max(cnt - 8, 0)
+                penalty += 50000.0 * under + 30000.0 * over
+
+    return penalty
+
+
+@njit(cache=True)
+def fitness_kernel(crop_id, area, land_type_idx, yield_tbl, cost_tbl, price_tbl,
+                   expected, bean_mask, scenario, revenue_upper, best_known):
+    """计算适应度（利润减惩罚）
+
+    先算惩罚(比收入便宜得多): 若收入上界减惩罚已不可能超过best_known,
+    直接返回-inf, 省掉整个收入遍历。然后按(年,作物)聚合总产量和
+    全价收入, 逐年按预期销售量(年度口径)折算实际收入。
+    expected 中为inf的作物视为不限量。
+    """
+    n_lands, years, n_seasons = crop_id.shape
+    n_crops = expected.size - 1
+
+    penalty = penalty_kernel(crop_id, area, bean_mask, n_crops)
+    if revenue_upper - penalty <= best_known:
+        return -np.inf
+
+    agg_yield = np.zeros((years, n_crops + 1))
+    agg_revenue = np.zeros((years, n_crops + 1))
+    total_cost = 0.0
+
+    for l in range(n_lands):
+        lt = land_type_idx[l]
+        for y in range(years):
+            for s in range(n_seasons):
+                c = crop_id[l, y, s]
+                if c < 0:
+                    continue
+                a = area[l, y, s]
+                ty = yield_tbl[c, lt, s] * a
+                agg_yield[y, c] += ty
+                agg_revenue[y, c] += ty * price_tbl[c, lt, s]
+                total_cost += cost_tbl[c, lt, s] * a
+
+    revenue = 0.0
+    for y in range(years):
+        for c in range(n_crops + 1):
+            revenue += _crop_revenue(agg_yield[y, c], agg_revenue[y, c],
+                                     expected[c], scenario)
+
+    return revenue - total_cost - penalty
+
+
+@njit(cache=True)
+def _crop_revenue(agg_yield_c, agg_revenue_c, expected_c, scenario):
+    """单个作物按预期销售量折算后的收入"""
+    if agg_yield_c <= 0.0:
+        return 0.0
+    if expected_c >= agg_yield_c:
+        frac = 1.0
+    else:
+        frac = expected_c / agg_yield_c
+    if scenario == 1:  # 滞销
+        return agg_revenue_c * frac
+    return agg_revenue_c * (0.5 + 0.5 * frac)  # 降价50%
+
+
+@njit(cache=True)
+def _conc_penalty_one(cnt):
+    """单个(年,季次,作物)计数的集中度惩罚(无分支)"""
+    under = max(2 - cnt, 0) * np.int32(cnt > 0)
+    over = max(cnt - 8, 0)
+    return 50000.0 * under + 30000.0 * over
+
+
+@njit(cache=True)
+def _land_replant_penalty(crop_id, l):
+    """单个地块的重茬惩罚(整行重算, O(年数x季次))"""
+    penalty = 0.0
+    prev = -1
+    years = crop_id.shape[1]
+    n_seasons = crop_id.shape[2]
+    for y in range(years):
+        for s in range(n_seasons):
+            c = crop_id[l, y, s]
+            if c < 0:
+                continue
+            if c == prev:
+                penalty += 50000.0
+            prev = c
+    return penalty
+
+
+# scalars数组各分量的含义 (增量搜索状态)
+# 0: 总成本  1: 集中度惩罚  2: 最小面积惩罚  3: 重茬惩罚  4: 豆类惩罚
+N_STATE_SCALARS = 5
+
+
+@njit(cache=True)
+def init_search_state(crop_id, area, land_type_idx, yield_tbl, cost_tbl,
+                      price_tbl, bean_mask, n_crops):
+    """为增量局部搜索建立一次性的聚合状态
+
+    产量/收入按(年,作物)聚合, 销量折算与fitness_kernel同为年度口径。
+    """
+    n_lands, years, n_seasons = crop_id.shape
+    agg_yield = np.zeros((years, n_crops + 1))
+    agg_revenue = np.zeros((years, n_crops + 1))
+    counts = np.zeros((years, n_seasons, n_crops + 1), dtype=np.int32)
+    bean_count = np.zeros(n_lands, dtype=np.int32)
+    replant_pen = np.zeros(n_lands)
+    scalars = np.zeros(N_STATE_SCALARS)
+
+    for l in range(n_lands):
+        lt = land_type_idx[l]
+        for y in range(years):
+            for s in range(n_seasons):
+                c = crop_id[l, y, s]
+                if c < 0:
+                    continue
+                a = area[l, y, s]
+                ty = yield_tbl[c, lt, s] * a
+                agg_yield[y, c] += ty
+                agg_revenue[y, c] += ty * price_tbl[c, lt, s]
+                scalars[0] += cost_tbl[c, lt, s] * a
+                counts[y, s, c] += 1
+                if bean_mask[c]:
+                    bean_count[l] += 1
+                if a < 0.5:
+                    scalars[2] += 20000.0 * (0.5 - a)
+        replant_pen[l] = _land_replant_penalty(crop_id, l)
+        scalars[3] += replant_pen[l]
+        if bean_count[l] == 0:
+            scalars[4] += 100000.0
+
+    for y in range(years):
+        for s in range(n_seasons):
+            for c in range(n_crops + 1):
+                scalars[1] += _conc_penalty_one(counts[y, s, c])
+
+    return agg_yield, agg_revenue, counts, bean_count, replant_pen, scalars
+
+
+@njit(cache=True)
+def state_fitness(agg_yield, agg_revenue, expected, scalars, scenario):
+    """由聚合状态计算适应度(收入按(年,作物)数组重算, O(年数*作物数))"""
+    revenue = 0.0
+    for y in range(agg_yield.shape[0]):
+        for c in range(agg_yield.shape[1]):
+            revenue += _crop_revenue(agg_yield[y, c], agg_revenue[y, c],
+                                     expected[c], scenario)
+    return (revenue - scalars[0] - scalars[1] - scalars[2]
+            - scalars[3] - scalars[4])
+
+
+@njit(cache=True)
+def apply_cell_change(crop_id, area, l, y, old_crop, old_area, land_type_idx,
+                      yield_tbl, cost_tbl, price_tbl, bean_mask, expected,
+                      scenario, agg_yield, agg_revenue, counts, bean_count,
+                      replant_pen, scalars):
+    """把(地块l,年y)从old_*切换到数组当前值, 增量更新状态并返回新适应度
+
+    只触及被修改单元格涉及的作物聚合量、该(年,季次)的集中度计数、
+    该地块的豆类计数与重茬惩罚 — 其余状态保持不变。
+    用交换new/old再调用一次即可回滚。
+    """
+    n_seasons = crop_id.shape[2]
+    lt = land_type_idx[l]
+    bean_was_zero = bean_count[l] == 0
+
+    for s in range(n_seasons):
+        c0 = old_crop[s]
+        a0 = old_area[s]
+        c1 = crop_id[l, y, s]
+        a1 = area[l, y, s]
+        if c0 == c1 and a0 == a1:
+            continue
+
+        if c0 >= 0:  # 移除旧单元格的贡献
+            ty = yield_tbl[c0, lt, s] * a0
+            agg_yield[y, c0] -= ty
+            agg_revenue[y, c0] -= ty * price_tbl[c0, lt, s]
+            scalars[0] -= cost_tbl[c0, lt, s] * a0
+            scalars[1] -= _conc_penalty_one(counts[y, s, c0])
+            counts[y, s, c0] -= 1
+            scalars[1] += _conc_penalty_one(counts[y, s, c0])
+            if bean_mask[c0]:
+                bean_count[l] -= 1
+            if a0 < 0.5:
+                scalars[2] -= 20000.0 * (0.5 - a0)
+
+        if c1 >= 0:  # 加入新单元格的贡献
+            ty = yield_tbl[c1, lt, s] * a1
+            agg_yield[y, c1] += ty
+            agg_revenue[y, c1] += ty * price_tbl[c1, lt, s]
+            scalars[0] += cost_tbl[c1, lt, s] * a1
+            scalars[1] -= _conc_penalty_one(counts[y, s, c1])
+            counts[y, s, c1] += 1
+            scalars[1] += _conc_penalty_one(counts[y, s, c1])
+            if bean_mask[c1]:
+                bean_count[l] += 1
+            if a1 < 0.5:
+                scalars[2] += 20000.0 * (0.5 - a1)
+
+    # 豆类惩罚: 只看该地块是否从有豆变无豆(或反之)
+    bean_is_zero = bean_count[l] == 0
+    if bean_was_zero and not bean_is_zero:
+        scalars[4] -= 100000.0
+    elif not bean_was_zero and bean_is_zero:
+        scalars[4] += 100000.0
+
+    # 重茬惩罚: 修改会影响跨年的相邻关系, 重算该地块一行
+    new_pen = _land_replant_penalty(crop_id, l)
+    scalars[3] += new_pen - replant_pen[l]
+    replant_pen[l] = new_pen
+
+    return state_fitness(agg_yield, agg_revenue, expected, scalars, scenario)
+
+
+@njit(cache=True)
+def fill_cell_kernel(crop_id, area, l, y, lt, land_area, cand_tbl, cand_len):
+    """按地块类型随机生成(地块l,年y)的种植方案(候选作物由cand_tbl给出)"""
+    n_seasons = crop_id.shape[2]
+    for s in range(n_seasons):
+        crop_id[l, y, s] = -1
+        area[l, y, s] = 0.0
+
+    if lt <= 2:  # 平旱地/梯田/山坡地: 单季粮食
+        n = cand_len[lt, 0]
+        if n > 0:
+            crop_id[l, y, 0] = cand_tbl[lt, 0, np.random.randint(n)]
+            area[l, y, 0] = land_area
+    elif lt == 3:  # 水浇地: 单季水稻或两季蔬菜
+        if np.random.random() < 0.5:
+            crop_id[l, y, 0] = cand_tbl[3, 0, 0]
+            area[l, y, 0] = land_area
+        else:
+            for s in range(1, n_seasons):
+                n = cand_len[3, s]
+                if n > 0:
+                    crop_id[l, y, s] = cand_tbl[3, s, np.random.randint(n)]
+                    area[l, y, s] = land_area
+    else:  # 大棚: 按候选表种两季
+        for s in range(1, n_seasons):
+            n = cand_len[lt, s]
+            if n > 0:
+                crop_id[l, y, s] = cand_tbl[lt, s, np.random.randint(n)]
+                area[l, y, s] = land_area
+
+
+@njit(cache=True, parallel=True)
+def multistart_kernel(seeds, years, n_seasons, land_type_idx, land_areas,
+                      cand_tbl, cand_len, yield_tbl, cost_tbl, price_tbl,
+                      expected, bean_mask, scenario):
+    """并行生成多个初始解并评估适应度
+
+    每个多起点相互独立, 用prange分摊到各核; numba核函数不持有GIL,
+    线程可以真正并发。每个起点用自己的种子, 结果可复现。
+    """
+    n_starts = seeds.size
+    n_lands = land_type_idx.size
+    all_crop = np.empty((n_starts, n_lands, years, n_seasons), dtype=np.int16)
+    all_area = np.empty((n_starts, n_lands, years, n_seasons), dtype=np.float64)
+    fitnesses = np.empty(n_starts)
+
+    for i in prange(n_starts):
+        np.random.seed(seeds[i])
+        for l in range(n_lands):
+            for y in range(years):
+                fill_cell_kernel(all_crop[i], all_area[i], l, y,
+                                 land_type_idx[l], land_areas[l],
+                                 cand_tbl, cand_len)
+        # 各起点并行评估, 无已知最优可剪枝, 上界传inf/最优传-inf即不剪
+        fitnesses[i] = fitness_kernel(all_crop[i], all_area[i], land_type_idx,
+                                      yield_tbl, cost_tbl, price_tbl,
+                                      expected, bean_mask, scenario,
+                                      np.inf, -np.inf)
+
+    return fitnesses, all_crop, all_area
+
+
+def warmup_kernels():
+    """用极小的假数据调用一次核函数, 触发JIT编译
+
+    这样编译时间不会算在优化循环里。
+    """
+    crop_id = np.zeros((1, 1, 1), dtype=np.int16)
+    area = np.ones((1, 1, 1), dtype=np.float64)
+    land_type_idx = np.zeros(1, dtype=np.int8)
+    tbl = np.zeros((2, 1, 1), dtype=np.float64)
+    expected = np.full(2, np.inf, dtype=np.float64)
+    bean_mask = np.zeros(2, dtype=np.bool_)
+    fitness_kernel(crop_id, area, land_type_idx, tbl, tbl, tbl,
+                   expected, bean_mask, 1, np.inf, -np.inf)
+    state = init_search_state(crop_id, area, land_type_idx, tbl, tbl, tbl,
+                              bean_mask, 1)
+    apply_cell_change(crop_id, area, 0, 0, crop_id[0, 0].copy(),
+                      area[0, 0].copy(), land_type_idx, tbl, tbl, tbl,
+                      bean_mask, expected, 1, *state)
+    seeds = np.zeros(1, dtype=np.int64)
+    cand_tbl = np.zeros((6, 1, 1), dtype=np.int16)
+    cand_len = np.zeros((6, 1), dtype=np.int16)
+    multistart_kernel(seeds, 1, 1, land_type_idx, area[:, 0, 0], cand_tbl,
+                      cand_len, tbl, tbl, tbl, expected, bean_mask, 1)
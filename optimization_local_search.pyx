@@ -0,0 +1,123 @@
+# cython: boundscheck=False, wraparound=False, cdivision=True, language_level=3
+"""Cython版本的适应度/惩罚核函数
+
+与 optimization_kernels.py 中的numba实现语义一致, 供不便引入numba的
+部署环境使用。先用 `python setup.py build_ext --inplace` 编译,
+optimization.py 会优先导入编译好的扩展, 失败时退回numba或纯NumPy。
+"""
+import numpy as np
+
+INF = float('inf')
+
+
+def penalty_kernel(crop_id, area, bean_mask, int n_crops):
+    """计算约束违反的惩罚(与numba版penalty_kernel一致)"""
+    return _penalty(crop_id, area, bean_mask.view(np.uint8), n_crops)
+
+
+def fitness_kernel(crop_id, area, land_type_idx, yield_tbl, cost_tbl,
+                   price_tbl, expected, bean_mask, int scenario,
+                   double revenue_upper, double best_known):
+    """计算适应度（利润减惩罚, 与numba版fitness_kernel一致）"""
+    return _fitness(crop_id, area, land_type_idx, yield_tbl, cost_tbl,
+                    price_tbl, expected, bean_mask.view(np.uint8), scenario,
+                    revenue_upper, best_known)
+
+
+cdef double _penalty(short[:, :, :] crop_id, double[:, :, :] area,
+                     unsigned char[:] bean_mask, int n_crops):
+    cdef int n_lands = crop_id.shape[0]
+    cdef int years = crop_id.shape[1]
+    cdef int n_seasons = crop_id.shape[2]
+    cdef int l, y, s, c, cnt, prev, under, over
+    cdef bint has_bean
+    cdef double penalty = 0.0
+    cdef double a
+
+    counts_arr = np.zeros((years, n_seasons, n_crops + 1), dtype=np.int32)
+    cdef int[:, :, :] counts = counts_arr
+
+    for l in range(n_lands):
+        has_bean = False
+        prev = -1
+        for y in range(years):
+            for s in range(n_seasons):
+                c = crop_id[l, y, s]
+                if c < 0:
+                    continue
+                if bean_mask[c]:
+                    has_bean = True
+                if c == prev:
+                    penalty += 50000.0
+                prev = c
+                counts[y, s, c] += 1
+                a = area[l, y, s]
+                if a < 0.5:
+                    penalty += 20000.0 * (0.5 - a)
+        if not has_bean:
+            penalty += 100000.0
+
+    # 无分支的集中度惩罚
+    for y in range(years):
+        for s in range(n_seasons):
+            for c in range(n_crops + 1):
+                cnt = counts[y, s, c]
+                under = max(2 - cnt, 0) * (cnt > 0)
+                over = max(cnt - 8, 0)
+                penalty += 50000.0 * under + 30000.0 * over
+
+    return penalty
+
+
+cdef double _fitness(short[:, :, :] crop_id, double[:, :, :] area,
+                     signed char[:] land_type_idx,
+                     double[:, :, :] yield_tbl, double[:, :, :] cost_tbl,
+                     double[:, :, :] price_tbl, double[:] expected,
+                     unsigned char[:] bean_mask, int scenario,
+                     double revenue_upper, double best_known):
+    cdef int n_lands = crop_id.shape[0]
+    cdef int years = crop_id.shape[1]
+    cdef int n_seasons = crop_id.shape[2]
+    cdef int n_crops = expected.shape[0] - 1
+    cdef int l, y, s, c, lt
+    cdef double a, ty, frac
+    cdef double total_cost = 0.0
+    cdef double revenue = 0.0
+
+    # 惩罚先行: 上界剪枝时连收入遍历都不用做
+    cdef double penalty = _penalty(crop_id, area, bean_mask, n_crops)
+    if revenue_upper - penalty <= best_known:
+        return -INF
+
+    agg_yield_arr = np.zeros((years, n_crops + 1))
+    agg_revenue_arr = np.zeros((years, n_crops + 1))
+    cdef double[:, :] agg_yield = agg_yield_arr
+    cdef double[:, :] agg_revenue = agg_revenue_arr
+
+    for l in range(n_lands):
+        lt = land_type_idx[l]
+        for y in range(years):
+            for s in range(n_seasons):
+                c = crop_id[l, y, s]
+                if c < 0:
+                    continue
+                a = area[l, y, s]
+                ty = yield_tbl[c, lt, s] * a
+                agg_yield[y, c] += ty
+                agg_revenue[y, c] += ty * price_tbl[c, lt, s]
+                total_cost += cost_tbl[c, lt, s] * a
+
+    for y in range(years):
+        for c in range(n_crops + 1):
+            if agg_yield[y, c] <= 0.0:
+                continue
+            if expected[c] >= agg_yield[y, c]:
+                frac = 1.0
+            else:
+                frac = expected[c] / agg_yield[y, c]
+            if scenario == 1:  # 滞销
+                revenue += agg_revenue[y, c] * frac
+            else:  # 降价50%
+                revenue += agg_revenue[y, c] * (0.5 + 0.5 * frac)
+
+    return revenue - total_cost - penalty
@@ -0,0 +1,20 @@
+"""编译Cython核函数扩展: python setup.py build_ext --inplace
+
+扩展是可选的 — 未编译时 optimization.py 会退回numba或纯NumPy实现。
+"""
+from setuptools import Extension, setup
+from Cython.Build import cythonize
+
+extensions = [
+    Extension(
+        'optimization_local_search',
+        ['optimization_local_search.pyx'],
+        # 不开 -ffast-math: expected数组用inf表示不限量, 需要严格的IEEE比较
+        extra_compile_args=['-O3'],
+    ),
+]
+
+setup(
+    name='crop-optimization-kernels',
+    ext_modules=cythonize(extensions, language_level=3),
+)
@@ -1,8 +1,27 @@
+import os
+
 import pandas as pd
 import numpy as np
+from dataclasses import dataclass
 from typing import Dict, List, Tuple
 from tqdm import tqdm
 
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:  # numba不可用时验证器退回NumPy实现
+    HAS_NUMBA = False
+
+
+@dataclass(slots=True)
+class PlantingCell:
+    """一个(地块, 年, 季次)单元格的种植记录
+
+    用slots数据类代替逐单元格的字典, 每个单元格省掉一份dict头开销。
+    """
+    crop_id: int
+    area: float
+
 
 class DataLoader:
     def __init__(self):
@@ -10,99 +29,175 @@ class DataLoader:
         self.land_data = None
         self.planting_data = None
         self.stats_data = None
+        self.file1 = None
+        self.file2 = None
+        self._preprocessed = None
+
+    def load_data(self, file1: str, file2: str, use_cache: bool = True) -> None:
+        """加载附件1和附件2的数据
+
+        use_cache为True时把各工作表缓存为Parquet(列式、C层解析),
+        后续运行跳过openpyxl的XML解析; 缓存早于xlsx时自动重建。
+        """
+        # 记录来源文件, 供子进程重建加载器(见visualization._render)
+        self.file1, self.file2 = file1, file2
 
-    def load_data(self, file1: str, file2: str) -> None:
-        """加载附件1和附件2的数据"""
         # 加载附件1
-        self.land_data = pd.read_excel(file1, sheet_name='乡村的现有耕地')
-        self.crop_data = pd.read_excel(file1, sheet_name='乡村种植的农作物')
+        self.land_data = self._read_sheet(file1, '乡村的现有耕地', use_cache)
+        self.crop_data = self._read_sheet(file1, '乡村种植的农作物', use_cache)
 
         # 加载附件2
-        self.planting_data = pd.read_excel(file2, sheet_name='2023年的农作物种植情况')
-        self.stats_data = pd.read_excel(file2, sheet_name='2023年统计的相关数据')
+        self.planting_data = self._read_sheet(file2, '2023年的农作物种植情况', use_cache)
+        self.stats_data = self._read_sheet(file2, '2023年统计的相关数据', use_cache)
+
+    # 各工作表实际用到的列及其目标dtype: 解析时跳过说明列,
+    # 低基数字符串列直接读成category、数值列读成float32
+    # (编号列混有"注："等说明行, 不在这里强转)
+    _SHEET_SPECS = {
+        '乡村的现有耕地': (
+            ['地块名称', '地块类型', '地块面积/亩'],
+            {'地块类型': 'category', '地块面积/亩': 'float32'}),
+        '乡村种植的农作物': (
+            ['作物编号', '作物名称', '作物类型', '种植耕地'],
+            {'作物类型': 'category'}),
+        '2023年的农作物种植情况': (
+            ['种植地块', '作物编号', '作物名称', '作物类型',
+             '种植面积/亩', '种植季次'],
+            {'种植地块': 'category', '种植季次': 'category',
+             '种植面积/亩': 'float32'}),
+        '2023年统计的相关数据': (
+            ['序号', '作物编号', '地块类型', '种植季次',
+             '亩产量/斤', '种植成本/(元/亩)', '销售单价/(元/斤)'],
+            {'地块类型': 'category', '种植季次': 'category',
+             '亩产量/斤': 'float32', '种植成本/(元/亩)': 'float32'}),
+    }
+
+    @classmethod
+    def _read_sheet(cls, path: str, sheet_name: str,
+                    use_cache: bool) -> pd.DataFrame:
+        """读取单个工作表, 可选经由Parquet缓存"""
+        usecols, dtype = cls._SHEET_SPECS.get(sheet_name, (None, None))
+        if not use_cache:
+            return pd.read_excel(path, sheet_name=sheet_name,
+                                 usecols=usecols, dtype=dtype)
+
+        cache_dir = path + '.parquet_cache'
+        cache = os.path.join(cache_dir, sheet_name + '.parquet')
+        if (os.path.exists(cache)
+                and os.path.getmtime(cache) >= os.path.getmtime(path)):
+            df = pd.read_parquet(cache)
+            # 兼容按旧格式写入的缓存(列更多、dtype未收窄)
+            if usecols is not None and set(usecols) <= set(df.columns):
+                return df[usecols]
+            return df
+
+        df = pd.read_excel(path, sheet_name=sheet_name,
+                           usecols=usecols, dtype=dtype)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            # 编号列里混有"注："等说明行, Arrow不接受混合类型,
+            # 统一转为字符串列; 预处理本来就对编号做int()强转
+            obj_cols = [c for c in df.columns if df[c].dtype == object]
+            df.astype({c: 'string' for c in obj_cols}).to_parquet(cache)
+        except (ImportError, OSError, ValueError):
+            # 无pyarrow或缓存目录不可写时直接返回, 不影响正常加载
+            pass
+        return df
 
     def preprocess_data(self) -> Tuple[Dict, Dict, Dict, Dict, Dict]:
-        """预处理数据，返回所需的各种字典"""
+        """预处理数据，返回所需的各种字典
+
+        结果在实例上缓存, 重复调用(如优化器与可视化共用同一个
+        DataLoader时)只做一次逐行遍历。
+        """
+        if self._preprocessed is not None:
+            return self._preprocessed
+
+        # 各循环直接zip各列的ndarray, 避免iterrows逐行构造Series
+
         # 地块信息
         land_info = {}
-        for _, row in self.land_data.iterrows():
-            if pd.notna(row['地块名称']):
-                land_info[row['地块名称']] = {
-                    'type': row['地块类型'],
-                    'area': row['地块面积/亩']
-                }
+        for name, ltype, larea in zip(self.land_data['地块名称'].to_numpy(),
+                                      self.land_data['地块类型'].to_numpy(),
+                                      self.land_data['地块面积/亩'].to_numpy()):
+            if pd.notna(name):
+                land_info[name] = {'type': ltype, 'area': larea}
 
         # 作物信息
         crop_info = {}
-        for _, row in self.crop_data.iterrows():
-            if pd.notna(row['作物编号']):
+        for cid, cname, ctype, cland in zip(
+                self.crop_data['作物编号'].to_numpy(),
+                self.crop_data['作物名称'].to_numpy(),
+                self.crop_data['作物类型'].to_numpy(),
+                self.crop_data['种植耕地'].to_numpy()):
+            if pd.notna(cid):
                 try:
-                    crop_id = int(row['作物编号'])
-                    crop_info[crop_id] = {
-                        'name': row['作物名称'],
-                        'type': row['作物类型'],
-                        'suitable_land': row['种植耕地']
+                    crop_info[int(cid)] = {
+                        'name': cname,
+                        'type': ctype,
+                        'suitable_land': cland
                     }
                 except (ValueError, TypeError):
                     # 跳过非数字的作物编号（如注释行）
                     continue
 
-        # 2023年种植情况
-        planting_2023 = {}
-        for _, row in self.planting_data.iterrows():
-            if pd.notna(row['种植地块']):
-                land = row['种植地块']
-                if land not in planting_2023:
-                    planting_2023[land] = []
-
-                planting_2023[land].append({
-                    'crop_id': row['作物编号'],
-                    'crop_name': row['作物名称'],
-                    'crop_type': row['作物类型'],
-                    'area': row['种植面积/亩'],
-                    'season': row['种植季次']
-                })
-
-        # 统计信息
+        # 2023年种植情况: 一次C层group-split代替逐行append
+        record_cols = {'作物编号': 'crop_id', '作物名称': 'crop_name',
+                       '作物类型': 'crop_type', '种植面积/亩': 'area',
+                       '种植季次': 'season'}
+        grouped = (self.planting_data.dropna(subset=['种植地块'])
+                   .rename(columns=record_cols)
+                   .groupby('种植地块', observed=True, sort=False))
+        planting_2023 = {
+            land: sub[list(record_cols.values())].to_dict('records')
+            for land, sub in grouped}
+
+        # 统计信息: "最低-最高"价格区间先整列正则提取,
+        # 循环里不再逐行做str拆分
+        price_bounds = (self.stats_data['销售单价/(元/斤)'].astype(str)
+                        .str.extract(r'([\d.]+)-([\d.]+)').astype(float))
         stats_info = {}
-        for _, row in self.stats_data.iterrows():
-            if pd.notna(row['序号']):
+        for seq, cid, ltype, season, ypm, cpm, minp, maxp in zip(
+                self.stats_data['序号'].to_numpy(),
+                self.stats_data['作物编号'].to_numpy(),
+                self.stats_data['地块类型'].to_numpy(),
+                self.stats_data['种植季次'].to_numpy(),
+                self.stats_data['亩产量/斤'].to_numpy(),
+                self.stats_data['种植成本/(元/亩)'].to_numpy(),
+                price_bounds[0].to_numpy(),
+                price_bounds[1].to_numpy()):
+            if pd.notna(seq) and pd.notna(minp):
                 try:
-                    crop_id = int(row['作物编号'])
-                    key = (crop_id, row['地块类型'], row['种植季次'])
-                    price_range = str(row['销售单价/(元/斤)']).split('-')
-
-                    stats_info[key] = {
-                        'yield_per_mu': row['亩产量/斤'],
-                        'cost_per_mu': row['种植成本/(元/亩)'],
-                        'min_price': float(price_range[0]),
-                        'max_price': float(price_range[1])
-                    }
+                    crop_id = int(cid)
                 except (ValueError, TypeError):
                     # 跳过非数字的作物编号（如注释行）
                     continue
+                stats_info[(crop_id, ltype, season)] = {
+                    'yield_per_mu': ypm,
+                    'cost_per_mu': cpm,
+                    'min_price': minp,
+                    'max_price': maxp
+                }
 
-        # 作物预期销售量 (从2023年种植情况估算)
-        expected_sales = {}
-        for land, crops in planting_2023.items():
-            for crop in crops:
-                crop_id = crop['crop_id']
-                land_type = land_info[land]['type']
-                season = crop['season']
-
-                key = (crop_id, land_type, season)
-                if key not in stats_info:
-                    continue
-
-                yield_per_mu = stats_info[key]['yield_per_mu']
-                total_yield = yield_per_mu * crop['area']
-
-                if crop_id not in expected_sales:
-                    expected_sales[crop_id] = total_yield
-                else:
-                    expected_sales[crop_id] += total_yield
+        # 作物预期销售量 (从2023年种植情况估算):
+        # 种植记录与地块类型、亩产量做merge后在C层groupby求和,
+        # 无匹配统计记录的行被内连接自然丢弃(与原先跳过的语义一致)
+        land_df = pd.DataFrame(
+            [(land, info['type']) for land, info in land_info.items()],
+            columns=['种植地块', 'land_type'])
+        stats_df = pd.DataFrame(
+            [(cid, ltype, season, stats['yield_per_mu'])
+             for (cid, ltype, season), stats in stats_info.items()],
+            columns=['作物编号', 'land_type', '种植季次', 'yield_per_mu'])
+        merged = (self.planting_data
+                  .merge(land_df, on='种植地块')
+                  .merge(stats_df, on=['作物编号', 'land_type', '种植季次']))
+        expected_sales = ((merged['yield_per_mu'] * merged['种植面积/亩'])
+                          .groupby(merged['作物编号']).sum().to_dict())
 
-        return land_info, crop_info, planting_2023, stats_info, expected_sales
+        self._preprocessed = (land_info, crop_info, planting_2023,
+                              stats_info, expected_sales)
+        return self._preprocessed
 
     def get_land_divisions(self, min_area=0.5) -> Dict:
         """将地块划分为更小的单位(如0.5亩)"""
@@ -125,64 +220,184 @@ class DataLoader:
         return land_divisions
 
 
-class SolutionValidator:
-    @staticmethod
-    def validate_rotation(solution: Dict, crop_info: Dict, years: int = 7) -> bool:
-        """验证豆类轮作约束"""
-        for land, crops in solution.items():
-            bean_planted = False
-            for year in range(years):
-                for season in ['单季', '第一季', '第二季']:
-                    if year in crops and season in crops[year]:
-                        crop_id = crops[year][season]['crop_id']
-                        if crop_info[crop_id]['type'] in ['粮食（豆类）', '蔬菜（豆类）']:
-                            bean_planted = True
-                            break
-                if bean_planted:
+SEASON_ORDER = ('单季', '第一季', '第二季')
+
+# 计入豆类轮作的作物类型
+BEAN_TYPES = ('粮食（豆类）', '蔬菜（豆类）')
+
+
+def bean_ids_from_crop_info(crop_info: Dict) -> frozenset:
+    """提取豆类作物编号集合, 供验证器复用(只需计算一次)"""
+    return frozenset(crop_id for crop_id, info in crop_info.items()
+                     if info['type'] in BEAN_TYPES)
+
+
+def solution_to_arrays(solution: Dict) -> Tuple[np.ndarray, np.ndarray]:
+    """把嵌套的解字典转成稠密数组 (plan, area)
+
+    plan[i, 年, 季次] 为作物编号(-1表示空), area为对应种植面积;
+    地块顺序取字典的遍历顺序。
+    """
+    lands = list(solution)
+    years = max((max(crops) for crops in solution.values() if crops),
+                default=-1) + 1
+    plan = np.full((len(lands), years, len(SEASON_ORDER)), -1, dtype=np.int16)
+    area = np.zeros((len(lands), years, len(SEASON_ORDER)))
+    for i, land in enumerate(lands):
+        for year, season_cells in solution[land].items():
+            for season, cell in season_cells.items():
+                s = SEASON_ORDER.index(season)
+                plan[i, year, s] = cell.crop_id
+                area[i, year, s] = cell.area
+    return plan, area
+
+
+if HAS_NUMBA:
+    # 验证核函数: 搜索循环可能调用上百万次, JIT去掉解释器开销
+
+    @njit(cache=True)
+    def _rotation_kernel(plan, bean_mask, years):
+        for l in range(plan.shape[0]):
+            has_bean = False
+            for y in range(min(years, plan.shape[1])):
+                for s in range(plan.shape[2]):
+                    c = plan[l, y, s]
+                    if c >= 0 and bean_mask[c]:
+                        has_bean = True
+                        break
+                if has_bean:
                     break
-            if not bean_planted:
+            if not has_bean:
                 return False
         return True
 
+    @njit(cache=True)
+    def _no_replant_kernel(plan):
+        for l in range(plan.shape[0]):
+            prev = -1
+            for y in range(plan.shape[1]):
+                for s in range(plan.shape[2]):
+                    c = plan[l, y, s]
+                    if c < 0:
+                        continue
+                    if c == prev:
+                        return False
+                    prev = c
+        return True
+
+    @njit(cache=True)
+    def _concentration_kernel(plan, n_crops, min_plots):
+        n_lands = plan.shape[0]
+        if n_lands <= 64:
+            # 每作物一个uint64位掩码记录出现过的地块, 置位代替哈希插入
+            masks = np.zeros(n_crops + 1, dtype=np.uint64)
+            for l in range(n_lands):
+                bit = np.uint64(1) << np.uint64(l)
+                for y in range(plan.shape[1]):
+                    for s in range(plan.shape[2]):
+                        c = plan[l, y, s]
+                        if c >= 0:
+                            masks[c] |= bit
+            one = np.uint64(1)
+            for c in range(n_crops + 1):
+                m = masks[c]
+                if m:
+                    # popcount, 数到min_plots即可停
+                    cnt = 0
+                    while m != 0 and cnt < min_plots:
+                        m &= m - one
+                        cnt += 1
+                    if cnt < min_plots:
+                        return False
+            return True
+
+        # 地块数超过64时退回逐地块去重计数
+        land_counts = np.zeros(n_crops + 1, dtype=np.int32)
+        seen = np.zeros(n_crops + 1, dtype=np.uint8)
+        for l in range(n_lands):
+            seen[:] = 0
+            for y in range(plan.shape[1]):
+                for s in range(plan.shape[2]):
+                    c = plan[l, y, s]
+                    if c >= 0 and not seen[c]:
+                        seen[c] = 1
+                        land_counts[c] += 1
+        for c in range(n_crops + 1):
+            if 0 < land_counts[c] < min_plots:
+                return False
+        return True
+
+    @njit(cache=True)
+    def _min_area_kernel(plan, area, min_area):
+        for l in range(plan.shape[0]):
+            for y in range(plan.shape[1]):
+                for s in range(plan.shape[2]):
+                    if plan[l, y, s] >= 0 and area[l, y, s] < min_area:
+                        return False
+        return True
+
+
+class SolutionValidator:
+    """解的约束检查
+
+    各验证方法既接受嵌套解字典, 也接受 solution_to_arrays 生成的
+    (plan, area) 数组 — 热路径调用方可以只转换一次、反复检查。
+    """
+
+    @staticmethod
+    def _as_arrays(solution) -> Tuple[np.ndarray, np.ndarray]:
+        if isinstance(solution, dict):
+            return solution_to_arrays(solution)
+        return solution
+
     @staticmethod
-    def validate_no_replant(solution: Dict) -> bool:
+    def validate_rotation(solution, bean_ids, years: int = 7) -> bool:
+        """验证豆类轮作约束
+
+        bean_ids为豆类作物编号集合(见bean_ids_from_crop_info),
+        由调用方预先算好, 避免每次验证都扫描crop_info。
+        """
+        plan, _ = SolutionValidator._as_arrays(solution)
+        n = max(max(bean_ids, default=0), int(plan.max())) + 2
+        bean_mask = np.zeros(n, dtype=bool)
+        bean_mask[list(bean_ids)] = True
+        if HAS_NUMBA:
+            return bool(_rotation_kernel(plan, bean_mask, years))
+        # plan为-1的空单元格落在掩码末位(False), 不影响判断
+        has_bean = bean_mask[plan[:, :years]].any(axis=(1, 2))
+        return bool(has_bean.all())
+
+    @staticmethod
+    def validate_no_replant(solution) -> bool:
         """验证无重茬种植"""
-        for land, crops in solution.items():
-            prev_crop = None
-            for year in range(len(crops)):
-                for season in ['单季', '第一季', '第二季']:
-                    if year in crops and season in crops[year]:
-                        current_crop = crops[year][season]['crop_id']
-                        if current_crop == prev_crop:
-                            return False
-                        prev_crop = current_crop
+        plan, _ = SolutionValidator._as_arrays(solution)
+        if HAS_NUMBA:
+            return bool(_no_replant_kernel(plan))
+        for row in plan.reshape(plan.shape[0], -1):
+            planted = row[row >= 0]
+            if (planted[1:] == planted[:-1]).any():
+                return False
         return True
 
     @staticmethod
-    def validate_concentration(solution: Dict, min_plots: int = 3) -> bool:
+    def validate_concentration(solution, min_plots: int = 3) -> bool:
         """验证作物种植不太分散"""
-        crop_distribution = {}
-        for land, crops in solution.items():
-            for year in range(len(crops)):
-                for season in ['单季', '第一季', '第二季']:
-                    if year in crops and season in crops[year]:
-                        crop_id = crops[year][season]['crop_id']
-                        if crop_id not in crop_distribution:
-                            crop_distribution[crop_id] = set()
-                        crop_distribution[crop_id].add(land)
-
-        for crop_id, lands in crop_distribution.items():
-            if len(lands) < min_plots:
-                return False
-        return True
+        plan, _ = SolutionValidator._as_arrays(solution)
+        if HAS_NUMBA:
+            return bool(_concentration_kernel(plan, int(plan.max()) + 1,
+                                              min_plots))
+        n_lands = plan.shape[0]
+        land_counts = np.zeros(plan.max() + 2, dtype=np.int32)
+        for i in range(n_lands):
+            crops = np.unique(plan[i])
+            land_counts[crops[crops >= 0]] += 1
+        present = land_counts > 0
+        return bool((land_counts[present] >= min_plots).all())
 
     @staticmethod
-    def validate_min_area(solution: Dict, min_area: float = 0.5) -> bool:
+    def validate_min_area(solution, min_area: float = 0.5) -> bool:
         """验证单个地块种植面积不小于最小值"""
-        for land, crops in solution.items():
-            for year in range(len(crops)):
-                for season in ['单季', '第一季', '第二季']:
-                    if year in crops and season in crops[year]:
-                        if crops[year][season]['area'] < min_area:
-                            return False
-        return True
\ No newline at end of file
+        plan, area = SolutionValidator._as_arrays(solution)
+        if HAS_NUMBA:
+            return bool(_min_area_kernel(plan, area, min_area))
+        return not bool(((plan >= 0) & (area < min_area)).any())
\ No newline at end of file
@@ -1,11 +1,62 @@
+import multiprocessing
+import os
+
+import matplotlib
+
+# 仅出PNG的场合(批量报告/无显示环境)设MPL_AGG=1, 跳过GUI后端初始化
+if os.environ.get('MPL_AGG'):
+    matplotlib.use('Agg')
+
 import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
 import seaborn as sns
+from concurrent.futures import ProcessPoolExecutor
 from typing import Dict, List
-import os
-from utils import DataLoader
-from optimization import CropOptimizer
+from utils import HAS_NUMBA, DataLoader, solution_to_arrays
+from optimization import (CropOptimizer, LAND_TYPES, LAND_TYPE_INDEX,
+                          SEASON_INDEX)
+
+if HAS_NUMBA:
+    from numba import njit
+
+    # expected里inf表示不限量, 需要严格IEEE比较, 故不开fastmath
+    @njit(cache=True)
+    def _profit_kernel(crop_ids, land_types, seasons, areas, year_idx,
+                       stats_arr, mean_price, expected, scenario, n_years):
+        """按(年, 作物)聚合后套用场景公式, 返回逐年利润数组"""
+        n_crops = expected.size
+        agg_yield = np.zeros((n_years, n_crops))
+        agg_revenue = np.zeros((n_years, n_crops))
+        cost = np.zeros(n_years)
+        for i in range(crop_ids.size):
+            c = crop_ids[i]
+            lt = land_types[i]
+            s = seasons[i]
+            ypm = stats_arr[c, lt, s, 0]
+            if np.isnan(ypm):
+                continue
+            y = year_idx[i]
+            a = areas[i]
+            ty = ypm * a
+            agg_yield[y, c] += ty
+            agg_revenue[y, c] += ty * mean_price[c, lt, s]
+            cost[y] += stats_arr[c, lt, s, 1] * a
+
+        profits = np.empty(n_years)
+        for y in range(n_years):
+            revenue = 0.0
+            for c in range(n_crops):
+                ay = agg_yield[y, c]
+                if ay <= 0.0:
+                    continue
+                frac = 1.0 if expected[c] >= ay else expected[c] / ay
+                if scenario == 1:  # 滞销
+                    revenue += agg_revenue[y, c] * frac
+                else:  # 降价50%
+                    revenue += agg_revenue[y, c] * (0.5 + 0.5 * frac)
+            profits[y] = revenue - cost[y]
+        return profits
 
 # 设置中文字体
 plt.rcParams['font.sans-serif'] = ['SimHei', 'Microsoft YaHei']
@@ -15,11 +66,79 @@ class CropVisualizer:
     def __init__(self, data_loader: DataLoader):
         self.data_loader = data_loader
         self.land_info, self.crop_info, self.planting_2023, self.stats_info, self.expected_sales = data_loader.preprocess_data()
+        self._build_stats_array()
+
+    def _build_stats_array(self) -> None:
+        """把 stats_info 展开为按(作物编号, 地块类型, 季次)整数下标的稠密数组
+
+        末维依次为(亩产量, 亩成本, 最低价, 最高价); 缺失组合为NaN,
+        查表时以NaN判断代替原来的 `key not in stats_info`。
+        """
+        n_crops = max(self.crop_info)
+        self._stats_arr = np.full(
+            (n_crops + 1, len(LAND_TYPE_INDEX), len(SEASON_INDEX), 4), np.nan)
+        for (crop_id, land_type, season), stats in self.stats_info.items():
+            lt = LAND_TYPE_INDEX.get(str(land_type).strip())
+            sn = SEASON_INDEX.get(str(season).strip())
+            if lt is None or sn is None:
+                continue
+            self._stats_arr[crop_id, lt, sn] = (
+                stats['yield_per_mu'], stats['cost_per_mu'],
+                stats['min_price'], stats['max_price'])
+
+        # 中间价只算一次, 利润计算不再逐行做(min+max)/2
+        self._mean_price = (self._stats_arr[..., 2]
+                            + self._stats_arr[..., 3]) / 2
+
+        # 地块名 -> 地块类型下标, 供逐年利润计算直接用整数索引
+        self._land_type_of = {
+            land: LAND_TYPE_INDEX[str(info['type']).strip()]
+            for land, info in self.land_info.items()}
+
+        # 预期销售量数组: 无记录的作物视为不限量(inf), 与优化器一致
+        self._expected_arr = np.full(n_crops + 1, np.inf)
+        for crop_id, sales in self.expected_sales.items():
+            self._expected_arr[crop_id] = sales
 
-    def plot_land_distribution(self, save_path: str = None):
+        # (解对象, 年份) -> 摊平数组的缓存: 同一个解在利润/面积/利用率
+        # 图表间复用, 嵌套字典只遍历一次
+        self._flat_cache = {}
+
+    def _flatten_solution(self, solution: Dict, year_idx: int):
+        """把某一年的嵌套解字典摊平成平行数组
+
+        返回 (作物编号, 地块类型下标, 季次下标, 面积) 四个ndarray,
+        供利润/面积统计做向量化计算。结果按(解, 年份)缓存;
+        缓存条目带上解对象本身做is校验, id()在对象回收后可能复用,
+        不能单独当键用。
+        """
+        key = (id(solution), year_idx)
+        cached = self._flat_cache.get(key)
+        if cached is not None and cached[0] is solution:
+            return cached[1]
+
+        rows = [(cell.crop_id, self._land_type_of[land],
+                 SEASON_INDEX[season], cell.area)
+                for land in solution
+                if year_idx in solution[land]
+                for season, cell in solution[land][year_idx].items()]
+        if not rows:
+            empty_i = np.empty(0, dtype=np.intp)
+            flat = (empty_i, empty_i, empty_i, np.empty(0))
+        else:
+            crop_ids, land_types, seasons, areas = zip(*rows)
+            flat = (np.asarray(crop_ids, dtype=np.intp),
+                    np.asarray(land_types, dtype=np.intp),
+                    np.asarray(seasons, dtype=np.intp),
+                    np.asarray(areas))
+        # 防止长期运行时缓存无限增长; 一张报告最多触及几个(解,年)组合
+        if len(self._flat_cache) >= 64:
+            self._flat_cache.clear()
+        self._flat_cache[key] = (solution, flat)
+        return flat
+
+    def plot_land_distribution(self, save_path: str = None, show: bool = None):
         """绘制地块分布图"""
-        plt.figure(figsize=(12, 8))
-        
         # 统计各地块类型的数量和面积
         land_types = {}
         land_areas = {}
@@ -50,9 +169,11 @@ class CropVisualizer:
         
         if save_path:
             plt.savefig(save_path, dpi=300, bbox_inches='tight')
-        plt.show()
+        # 默认只在未落盘时弹窗; 只存PNG的调用不再阻塞在show()上
+        if show if show is not None else save_path is None:
+            plt.show()
 
-    def plot_crop_distribution(self, save_path: str = None):
+    def plot_crop_distribution(self, save_path: str = None, show: bool = None):
         """绘制作物分布图"""
         plt.figure(figsize=(14, 8))
         
@@ -74,23 +195,18 @@ class CropVisualizer:
         
         if save_path:
             plt.savefig(save_path, dpi=300, bbox_inches='tight')
-        plt.show()
+        # 默认只在未落盘时弹窗; 只存PNG的调用不再阻塞在show()上
+        if show if show is not None else save_path is None:
+            plt.show()
 
-    def plot_optimization_results(self, solution1: Dict, solution2: Dict, save_path: str = None):
+    def plot_optimization_results(self, solution1: Dict, solution2: Dict, save_path: str = None, show: bool = None):
         """绘制优化结果对比图"""
         fig, axes = plt.subplots(2, 2, figsize=(16, 12))
         
-        # 计算每年的利润
+        # 计算每年的利润(7年一次扫描)
         years = list(range(2024, 2031))
-        profits1 = []
-        profits2 = []
-        
-        for year in years:
-            year_idx = year - 2024
-            profit1 = self._calculate_year_profit(solution1, year_idx, 1)
-            profit2 = self._calculate_year_profit(solution2, year_idx, 2)
-            profits1.append(profit1)
-            profits2.append(profit2)
+        profits1 = self._calculate_profit_series(solution1, 1, len(years))
+        profits2 = self._calculate_profit_series(solution2, 2, len(years))
         
         # 利润对比
         axes[0, 0].plot(years, profits1, 'b-o', label='滞销场景', linewidth=2, markersize=6)
@@ -139,35 +255,32 @@ class CropVisualizer:
         
         if save_path:
             plt.savefig(save_path, dpi=300, bbox_inches='tight')
-        plt.show()
+        # 默认只在未落盘时弹窗; 只存PNG的调用不再阻塞在show()上
+        if show if show is not None else save_path is None:
+            plt.show()
 
-    def plot_land_utilization(self, solution: Dict, scenario_name: str, save_path: str = None):
+    def plot_land_utilization(self, solution: Dict, scenario_name: str, save_path: str = None, show: bool = None):
         """绘制土地利用情况"""
         plt.figure(figsize=(14, 8))
         
-        # 统计各地块类型的利用率
-        land_utilization = {}
-        
-        for land, info in self.land_info.items():
-            land_type = info['type']
-            if land_type not in land_utilization:
-                land_utilization[land_type] = {'total_area': 0, 'used_area': 0}
-            
-            land_utilization[land_type]['total_area'] += info['area']
-            
-            # 计算该地块7年的总种植面积
-            for year in solution[land]:
-                for season in solution[land][year]:
-                    land_utilization[land_type]['used_area'] += solution[land][year][season]['area']
-        
-        # 计算利用率
-        land_types = list(land_utilization.keys())
-        utilization_rates = []
-        for land_type in land_types:
-            total = land_utilization[land_type]['total_area']
-            used = land_utilization[land_type]['used_area']
-            rate = (used / (total * 7)) * 100  # 7年总利用率
-            utilization_rates.append(rate)
+        # 统计各地块类型的利用率: 稠密面积数组按地块类型bincount,
+        # 代替逐单元格的四层字典索引
+        _, area_arr = solution_to_arrays(solution)
+        lt_codes = np.array([self._land_type_of[land] for land in solution])
+        used_by_type = np.bincount(lt_codes, weights=area_arr.sum(axis=(1, 2)),
+                                   minlength=len(LAND_TYPES))
+
+        total_codes = np.array([self._land_type_of[land]
+                                for land in self.land_info])
+        areas = np.array([info['area'] for info in self.land_info.values()])
+        total_by_type = np.bincount(total_codes, weights=areas,
+                                    minlength=len(LAND_TYPES))
+
+        present = np.flatnonzero(total_by_type)
+        land_types = [LAND_TYPES[i] for i in present]
+        # 7年总利用率
+        utilization_rates = list(
+            used_by_type[present] / (total_by_type[present] * 7) * 100)
         
         # 绘制柱状图
         bars = plt.bar(land_types, utilization_rates, color='lightgreen', edgecolor='darkgreen')
@@ -176,69 +289,120 @@ class CropVisualizer:
         plt.ylabel('利用率 (%)')
         plt.xticks(rotation=45, ha='right')
         
-        # 添加数值标签
-        for bar, rate in zip(bars, utilization_rates):
-            plt.text(bar.get_x() + bar.get_width()/2, bar.get_height() + 1, 
-                    f'{rate:.1f}%', ha='center', va='bottom')
+        # 添加数值标签(一次批量放置, 不逐条创建Text)
+        plt.gca().bar_label(
+            bars, labels=[f'{rate:.1f}%' for rate in utilization_rates],
+            padding=3)
         
         plt.tight_layout()
         
         if save_path:
             plt.savefig(save_path, dpi=300, bbox_inches='tight')
-        plt.show()
+        # 默认只在未落盘时弹窗; 只存PNG的调用不再阻塞在show()上
+        if show if show is not None else save_path is None:
+            plt.show()
 
     def _calculate_year_profit(self, solution: Dict, year_idx: int, scenario: int) -> float:
-        """计算指定年份的利润"""
-        total_profit = 0
-        
-        for land in solution:
-            land_type = self.land_info[land]['type']
-            
-            if year_idx in solution[land]:
-                for season in solution[land][year_idx]:
-                    crop_id = solution[land][year_idx][season]['crop_id']
-                    area = solution[land][year_idx][season]['area']
-                    
-                    key = (crop_id, land_type, season)
-                    if key not in self.stats_info:
-                        continue
-                    
-                    stats = self.stats_info[key]
-                    yield_per_mu = stats['yield_per_mu']
-                    cost = stats['cost_per_mu']
-                    price = (stats['min_price'] + stats['max_price']) / 2
-                    total_yield = yield_per_mu * area
-                    
-                    # 计算收入
-                    if crop_id in self.expected_sales:
-                        expected = self.expected_sales[crop_id]
-                        if scenario == 1:  # 滞销
-                            revenue = min(total_yield, expected) * price
-                        else:  # 降价50%
-                            revenue = min(total_yield, expected) * price + max(0, total_yield - expected) * price * 0.5
-                    else:
-                        revenue = total_yield * price
-                    
-                    # 减去成本
-                    total_profit += revenue - cost * area
-        
-        return total_profit
+        """计算指定年份的利润
+
+        整年一次性向量化计算: 按作物聚合该年产量后套用场景公式,
+        销量上限按全村当年合计产量折算。优化器的适应度同样按
+        (年,作物)折算销量, 两边口径一致(不含约束惩罚项)。
+        """
+        crop_ids, land_types, seasons, areas = \
+            self._flatten_solution(solution, year_idx)
+        if crop_ids.size == 0:
+            return 0.0
+
+        if HAS_NUMBA:
+            zeros = np.zeros(crop_ids.size, dtype=np.intp)
+            return float(_profit_kernel(
+                crop_ids, land_types, seasons, areas, zeros,
+                self._stats_arr, self._mean_price, self._expected_arr,
+                scenario, 1)[0])
+
+        stats = self._stats_arr[crop_ids, land_types, seasons]
+        prices = self._mean_price[crop_ids, land_types, seasons]
+        valid = ~np.isnan(stats[:, 0])
+        stats = stats[valid]
+        prices = prices[valid]
+        crop_ids = crop_ids[valid]
+        areas = areas[valid]
+
+        total_yield = stats[:, 0] * areas
+        total_cost = (stats[:, 1] * areas).sum()
+
+        n = self._expected_arr.size
+        agg_yield = np.bincount(crop_ids, weights=total_yield, minlength=n)
+        agg_revenue = np.bincount(crop_ids, weights=total_yield * prices,
+                                  minlength=n)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            frac = np.minimum(1.0, self._expected_arr / agg_yield)
+        frac = np.where(agg_yield > 0, frac, 0.0)
+        if scenario == 1:  # 滞销
+            revenue = (agg_revenue * frac).sum()
+        else:  # 降价50%
+            revenue = (agg_revenue * np.where(agg_yield > 0,
+                                              0.5 + 0.5 * frac, 0.0)).sum()
+        return float(revenue - total_cost)
+
+    def _calculate_profit_series(self, solution: Dict, scenario: int,
+                                 years: int = 7) -> np.ndarray:
+        """一次扫描算出逐年利润数组
+
+        把各年的摊平数组拼成一条, 按(年, 作物)联合下标bincount聚合,
+        一次gather+reduce代替逐年多次调用_calculate_year_profit。
+        """
+        n = self._expected_arr.size
+        flats = [self._flatten_solution(solution, y) for y in range(years)]
+        year_idx = np.concatenate(
+            [np.full(f[0].size, y, dtype=np.intp) for y, f in enumerate(flats)])
+        crop_ids = np.concatenate([f[0] for f in flats])
+        land_types = np.concatenate([f[1] for f in flats])
+        seasons = np.concatenate([f[2] for f in flats])
+        areas = np.concatenate([f[3] for f in flats])
+        if crop_ids.size == 0:
+            return np.zeros(years)
+
+        if HAS_NUMBA:
+            return _profit_kernel(crop_ids, land_types, seasons, areas,
+                                  year_idx, self._stats_arr, self._mean_price,
+                                  self._expected_arr, scenario, years)
+
+        stats = self._stats_arr[crop_ids, land_types, seasons]
+        prices = self._mean_price[crop_ids, land_types, seasons]
+        valid = ~np.isnan(stats[:, 0])
+        stats, prices, crop_ids, areas, year_idx = (
+            stats[valid], prices[valid], crop_ids[valid],
+            areas[valid], year_idx[valid])
+
+        total_yield = stats[:, 0] * areas
+        cost_per_year = np.bincount(year_idx, weights=stats[:, 1] * areas,
+                                    minlength=years)
+
+        # 销量上限逐年套用: 按(年, 作物)联合键聚合
+        comb = year_idx * n + crop_ids
+        agg_yield = np.bincount(comb, weights=total_yield,
+                                minlength=years * n).reshape(years, n)
+        agg_revenue = np.bincount(comb, weights=total_yield * prices,
+                                  minlength=years * n).reshape(years, n)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            frac = np.minimum(1.0, self._expected_arr / agg_yield)
+        planted = agg_yield > 0
+        frac = np.where(planted, frac, 0.0)
+        if scenario == 1:  # 滞销
+            revenue = (agg_revenue * frac).sum(axis=1)
+        else:  # 降价50%
+            revenue = (agg_revenue
+                       * np.where(planted, 0.5 + 0.5 * frac, 0.0)).sum(axis=1)
+        return revenue - cost_per_year
 
     def _get_crop_areas(self, solution: Dict, year_idx: int) -> Dict:
         """获取指定年份各作物的种植面积"""
-        crop_areas = {}
-        
-        for land in solution:
-            if year_idx in solution[land]:
-                for season in solution[land][year_idx]:
-                    crop_id = solution[land][year_idx][season]['crop_id']
-                    area = solution[land][year_idx][season]['area']
-                    
-                    if crop_id not in crop_areas:
-                        crop_areas[crop_id] = 0
-                    crop_areas[crop_id] += area
-        
-        return crop_areas
+        crop_ids, _, _, areas = self._flatten_solution(solution, year_idx)
+        totals = np.bincount(crop_ids, weights=areas,
+                             minlength=self._expected_arr.size)
+        return {cid: totals[cid] for cid in np.flatnonzero(totals)}
 
     def create_comprehensive_report(self, solution1: Dict, solution2: Dict, output_dir: str):
         """创建综合报告"""
@@ -246,16 +410,46 @@ class CropVisualizer:
         charts_dir = os.path.join(output_dir, 'charts')
         os.makedirs(charts_dir, exist_ok=True)
         
-        # 生成各种图表
-        self.plot_land_distribution(os.path.join(charts_dir, 'land_distribution.png'))
-        self.plot_crop_distribution(os.path.join(charts_dir, 'crop_distribution.png'))
-        self.plot_optimization_results(solution1, solution2, os.path.join(charts_dir, 'optimization_results.png'))
-        self.plot_land_utilization(solution1, '滞销场景', os.path.join(charts_dir, 'land_utilization_scenario1.png'))
-        self.plot_land_utilization(solution2, '降价50%场景', os.path.join(charts_dir, 'land_utilization_scenario2.png'))
-        
+        # 五张图互不依赖且各写各的文件, 交给进程池并行渲染;
+        # 渲染+PNG编码是CPU密集操作, 多进程绕开GIL
+        file1, file2 = self.data_loader.file1, self.data_loader.file2
+        tasks = [
+            (file1, file2, 'land_distribution', (),
+             os.path.join(charts_dir, 'land_distribution.png')),
+            (file1, file2, 'crop_distribution', (),
+             os.path.join(charts_dir, 'crop_distribution.png')),
+            (file1, file2, 'optimization_results', (solution1, solution2),
+             os.path.join(charts_dir, 'optimization_results.png')),
+            (file1, file2, 'land_utilization', (solution1, '滞销场景'),
+             os.path.join(charts_dir, 'land_utilization_scenario1.png')),
+            (file1, file2, 'land_utilization', (solution2, '降价50%场景'),
+             os.path.join(charts_dir, 'land_utilization_scenario2.png')),
+        ]
+        # spawn避免fork已初始化numba/BLAS线程池的父进程造成死锁
+        ctx = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=4, mp_context=ctx) as executor:
+            list(executor.map(_render, tasks))
+
         print(f"图表已保存到 {charts_dir}/")
 
 
+def _render(task):
+    """进程池工作函数: 在子进程里重建可视化器并渲染一张图
+
+    模块级函数才能被进程池pickle; Parquet缓存(见DataLoader)让
+    子进程重建加载器的开销可以忽略。
+    """
+    file1, file2, kind, args, save_path = task
+    plt.switch_backend('Agg')
+    data_loader = DataLoader()
+    data_loader.load_data(file1, file2)
+    visualizer = CropVisualizer(data_loader)
+    try:
+        getattr(visualizer, 'plot_' + kind)(*args, save_path, show=False)
+    finally:
+        plt.close('all')
+
+
 def main():
     # 获取当前脚本所在目录
     current_dir = os.path.dirname(os.path.abspath(__file__))